@@ -0,0 +1,183 @@
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from bench.corpus import generate_corpus
+from detection.BibNumberDetector import BibNumberDetector
+from detection.ProcessPoolDetector import ProcessPoolDetector
+from detection.image_utils import list_image_files
+import globals
+import metrics
+
+try:
+    import resource
+except ImportError:
+    # windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v.strip() != ""]
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    # milliseconds
+    values = np.asarray(values) * 1000
+    return {"p50": float(np.percentile(values, 50)), "p95": float(np.percentile(values, 95)),
+            "p99": float(np.percentile(values, 99)), "mean": float(values.mean()), "count": int(len(values))}
+
+
+def peak_rss_mb() -> dict[str, float] | None:
+    # ru_maxrss is in kilobytes on linux, the children value is the largest single worker process
+    if resource is not None:
+        return {"self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024}
+    # on windows psutil knows the peak working set of this process, the workers already exited
+    if psutil is not None and hasattr(psutil.Process().memory_info(), "peak_wset"):
+        return {"self": psutil.Process().memory_info().peak_wset / 2 ** 20}
+    return None
+
+
+def recall(results: dict[str, list[int]], expected: dict[str, list[int]] | None) -> float | None:
+    if expected is None:
+        return None
+    found = sum(len(set(results.get(os.path.normpath(f)) or []) & set(numbers)) for f, numbers in expected.items())
+    total = sum(len(set(numbers)) for numbers in expected.values())
+    return found / total if total > 0 else None
+
+
+def run_config(config: dict, files: list[str], expected: dict[str, list[int]] | None, log_level: int) -> dict:
+    # runs in a fresh process, so the model loading and the peak memory of one configuration
+    # do not influence the next one
+    globals.LOG_LEVEL = log_level
+    logging.basicConfig(level=log_level)
+    detector_args = dict(BATCH_SIZE=config["batch_size"], LONG_SIZE=config["long_size"],
+                         COARSE_LONG_SIZE=config["coarse_long_size"], CACHE=None)
+    with tempfile.TemporaryDirectory() as out_dir:
+        stages: dict[str, list[float]] = defaultdict(list)
+        if config["mode"] == "process":
+            # the workers record their stage timings as metrics, which are merged into this process
+            metrics.enable()
+            detector = ProcessPoolDetector(out_dir, config["workers"], 1, config["chunk_size"], **detector_args)
+            # starts the workers and loads their models
+            warmup = files[:config["workers"] * config["chunk_size"]]
+        else:
+            detector = BibNumberDetector(out_dir, config["threads"], **detector_args)
+
+            def record(_: str, timings: dict[str, float]):
+                for stage, seconds in timings.items():
+                    stages[stage].append(seconds)
+
+            detector.add_timing_listener(record)
+            warmup = files[:1]
+        with detector:
+            detector.detect_bib_numbers(warmup)
+            stages.clear()
+            metrics.REGISTRY.drain()
+            t0 = time.perf_counter()
+            results = detector.detect_bib_numbers(files)
+            elapsed = time.perf_counter() - t0
+    if config["mode"] == "process":
+        # the histograms of the workers only give the mean of every stage
+        stages_ms = {stage: {"mean": s["mean"] * 1000, "count": s["count"]}
+                     for stage, s in sorted(metrics.STAGE_SECONDS.summary().items())}
+        stages_note = "process mode: means of the worker metrics, no percentiles"
+    else:
+        stages_ms = {stage: percentiles(values) for stage, values in sorted(stages.items())}
+        stages_note = None
+    return {
+        "config": config,
+        "images": len(files),
+        "seconds": elapsed,
+        "images_per_sec": len(files) / elapsed if elapsed > 0 else None,
+        "stages_ms": stages_ms,
+        "stages_note": stages_note,
+        "peak_rss_mb": peak_rss_mb(),
+        "recall": recall(results, expected),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="measures throughput, per stage latency and memory of the detection "
+                                                 "for a sweep of configurations and prints the results as JSON")
+    parser.add_argument("--corpus", help="directory with fixture images, a synthetic corpus is generated if missing")
+    parser.add_argument("--images", help="number of synthetic images", default=20, type=int)
+    parser.add_argument("--height", default=1500, type=int)
+    parser.add_argument("--width", default=2000, type=int)
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--threads", help="comma separated thread counts (thread mode)", default="1,2,4",
+                        type=int_list)
+    parser.add_argument("--workers", help="comma separated worker counts (process mode)", default="",
+                        type=int_list)
+    parser.add_argument("--chunk-size", default=4, type=int)
+    parser.add_argument("--long-size", help="comma separated detection resolutions", default="1280",
+                        type=int_list)
+    parser.add_argument("--coarse-long-size", help="resolution of the coarse pass, two stage mode if given",
+                        type=int)
+    parser.add_argument("--batch-size", default=1, type=int)
+    parser.add_argument("--out", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("-log", "--log", help="log level", default="warning",
+                        choices=["debug", "info", "warning", "error", "critical"])
+    args = parser.parse_args()
+    log_level = getattr(logging, args.log.upper())
+    logging.basicConfig(level=log_level)
+
+    configs = [dict(mode="thread", threads=t, workers=None, chunk_size=None, long_size=ls)
+               for t, ls in itertools.product(args.threads, args.long_size)]
+    configs += [dict(mode="process", threads=1, workers=w, chunk_size=args.chunk_size, long_size=ls)
+                for w, ls in itertools.product(args.workers, args.long_size)]
+    for config in configs:
+        config.update(batch_size=args.batch_size, coarse_long_size=args.coarse_long_size)
+
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        if args.corpus is not None:
+            files, expected = list_image_files(args.corpus), None
+            corpus = {"path": os.path.abspath(args.corpus), "images": len(files)}
+        else:
+            expected = generate_corpus(corpus_dir, args.images, args.height, args.width, args.seed)
+            files = sorted(expected)
+            corpus = {"synthetic": True, "images": len(files), "height": args.height, "width": args.width,
+                      "seed": args.seed}
+
+        runs = []
+        # spawn, so every configuration starts without the memory and threads of the previous one
+        context = multiprocessing.get_context("spawn")
+        for config in configs:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                run = executor.submit(run_config, config, files, expected, log_level).result()
+            logging.info("{}: {:.2f} images/sec".format(config, run["images_per_sec"]))
+            runs.append(run)
+
+    report = {
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpu_count": os.cpu_count(), "opencv": cv2.__version__},
+        "corpus": corpus,
+        "runs": runs,
+    }
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import craft_text_detector.image_utils as image_utils
+import cv2
+import numpy as np
+
+from detection import backends
+from detection.ArtifactWriter import ArtifactLevel
+from detection.BibNumberDetector import BibNumberDetector
+from detection.CraftBatcher import get_predictions
+from detection.image_utils import list_image_files
+
+
+def score_text(backend, image: np.ndarray, long_size: int) -> np.ndarray:
+    # the raw text score map, preprocessed the same way get_predictions does for a single image
+    resized, _, _ = image_utils.resize_aspect_ratio(image, long_size, interpolation=cv2.INTER_LINEAR)
+    x = image_utils.normalizeMeanVariance(resized).transpose(2, 0, 1)[np.newaxis]
+    return backend.forward(np.ascontiguousarray(x, dtype=np.float32))[0][0]
+
+
+def run_backend(name: str, files: list[str], long_size: int, repeat: int) -> dict:
+    # runs in a fresh process, so the cold start includes loading (and the first time exporting) the models
+    t0 = time.perf_counter()
+    backend = backends.get_backend(name)
+    cold_start = time.perf_counter() - t0
+
+    latencies = []
+    score_maps = {}
+    for f in files:
+        image = cv2.cvtColor(cv2.imread(f), cv2.COLOR_BGR2RGB)
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            get_predictions([image], backend, long_size=long_size)
+            latencies.append(time.perf_counter() - t0)
+        score_maps[f] = score_text(backend, image, long_size)
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        with BibNumberDetector(out_dir, LONG_SIZE=long_size, ARTIFACTS=ArtifactLevel.NONE, BACKEND=name) as detector:
+            bibs = {f: detector.detect_bib_numbers_single(f) for f in files}
+    latencies = np.asarray(latencies) * 1000
+    return {"backend": name, "cold_start_s": cold_start, "forward_ms": {
+        "p50": float(np.percentile(latencies, 50)), "mean": float(latencies.mean())}, "bibs": bibs,
+        "score_maps": score_maps}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compares cold start, latency and results of the CRAFT backends "
+                                                 "on the fixture images and prints them as JSON")
+    parser.add_argument("imgs", help="images to compare on", nargs="*", default=["res/test/imgs"])
+    parser.add_argument("--backends", help="comma separated backends, the first one is the reference",
+                        default=",".join(backends.BACKENDS))
+    parser.add_argument("--long-size", default=1280, type=int)
+    parser.add_argument("--repeat", help="forward passes per image", default=3, type=int)
+    args = parser.parse_args()
+
+    files = [f for f in list_image_files(args.imgs) if cv2.haveImageReader(f)]
+    context = multiprocessing.get_context("spawn")
+    runs = []
+    for name in args.backends.split(","):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            runs.append(executor.submit(run_backend, name, files, args.long_size, args.repeat).result())
+
+    reference = runs[0]
+    report = []
+    for run in runs:
+        difference = max(float(np.abs(run["score_maps"][f] - reference["score_maps"][f]).max()) for f in files)
+        report.append({
+            "backend": run["backend"],
+            "cold_start_s": run["cold_start_s"],
+            "forward_ms": run["forward_ms"],
+            "speedup": reference["forward_ms"]["mean"] / run["forward_ms"]["mean"],
+            "max_score_difference": difference,
+            "same_bibs": sum(run["bibs"][f] == reference["bibs"][f] for f in files) / len(files),
+            "bibs": {os.path.basename(f): bibs for f, bibs in run["bibs"].items()},
+        })
+    json.dump({"reference": reference["backend"], "images": len(files), "long_size": args.long_size,
+               "backends": report}, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+import os
+
+import cv2
+import numpy as np
+
+
+def synthetic_frame(height: int, width: int, rng: np.random.Generator) -> tuple[np.ndarray, list[int]]:
+    # noisy background with a few runners, each one a coloured torso carrying a white bib with a black number,
+    # returns the BGR frame and the numbers on it
+    img = rng.integers(40, 200, (height // 8, width // 8, 3), dtype=np.uint8)
+    img = cv2.GaussianBlur(cv2.resize(img, (width, height), interpolation=cv2.INTER_LINEAR), (15, 15), 0)
+    numbers = []
+    for _ in range(int(rng.integers(1, 5))):
+        scale = rng.uniform(0.5, 1.5)
+        torso_w, torso_h = int(width * 0.12 * scale), int(height * 0.3 * scale)
+        x = int(rng.integers(0, max(width - torso_w, 1)))
+        y = int(rng.integers(height // 4, max(height - torso_h, height // 4 + 1)))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.rectangle(img, (x, y), (x + torso_w, y + torso_h), color, -1)
+
+        number = int(rng.integers(1, 999))
+        numbers.append(number)
+        bib_w, bib_h = int(torso_w * 0.8), int(torso_h * 0.3)
+        bx, by = x + (torso_w - bib_w) // 2, y + torso_h // 4
+        cv2.rectangle(img, (bx, by), (bx + bib_w, by + bib_h), (255, 255, 255), -1)
+        text = str(number)
+        font_scale = cv2.getFontScaleFromHeight(cv2.FONT_HERSHEY_SIMPLEX, int(bib_h * 0.6), 4)
+        (text_w, text_h), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 4)
+        cv2.putText(img, text, (bx + (bib_w - text_w) // 2, by + (bib_h + text_h) // 2),
+                    cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0), 4)
+    return img, numbers
+
+
+def generate_corpus(out_dir: str, count: int, height: int = 1500, width: int = 2000,
+                    seed: int = 0) -> dict[str, list[int]]:
+    # writes count jpg frames to out_dir, the same seed always gives the same corpus
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    corpus = {}
+    for i in range(count):
+        img, numbers = synthetic_frame(height, width, rng)
+        path = os.path.join(out_dir, "frame_{:04d}.jpg".format(i))
+        cv2.imwrite(path, img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        corpus[path] = numbers
+    return corpus
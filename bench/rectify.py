@@ -0,0 +1,115 @@
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from detection.rectify import rectify_poly
+
+
+def rectify_poly_reference(img, poly):
+    # the implementation before the ROI/remap rewrite, two full frame warps per polygon segment
+    # Use Affine transform
+    n = int(len(poly) / 2) - 1
+    width = 0
+    height = 0
+    for k in range(n):
+        box = np.float32([poly[k], poly[k + 1], poly[-k - 2], poly[-k - 1]])
+        width += int(
+            (np.linalg.norm(box[0] - box[1]) + np.linalg.norm(box[2] - box[3])) / 2
+        )
+        height += np.linalg.norm(box[1] - box[2])
+    width = int(width)
+    height = int(height / n)
+
+    output_img = np.zeros((height, width, 3), dtype=np.uint8)
+    width_step = 0
+    for k in range(n):
+        box = np.float32([poly[k], poly[k + 1], poly[-k - 2], poly[-k - 1]])
+        w = int((np.linalg.norm(box[0] - box[1]) + np.linalg.norm(box[2] - box[3])) / 2)
+
+        # Top triangle
+        pts1 = box[:3]
+        pts2 = np.float32(
+            [[width_step, 0], [width_step + w - 1, 0], [width_step + w - 1, height - 1]]
+        )
+        M = cv2.getAffineTransform(pts1, pts2)
+        warped_img = cv2.warpAffine(
+            img, M, (width, height), borderMode=cv2.BORDER_REPLICATE
+        )
+        warped_mask = np.zeros((height, width, 3), dtype=np.uint8)
+        warped_mask = cv2.fillConvexPoly(warped_mask, np.int32(pts2), (1, 1, 1))
+        output_img[warped_mask == 1] = warped_img[warped_mask == 1]
+
+        # Bottom triangle
+        pts1 = np.vstack((box[0], box[2:]))
+        pts2 = np.float32(
+            [
+                [width_step, 0],
+                [width_step + w - 1, height - 1],
+                [width_step, height - 1],
+            ]
+        )
+        M = cv2.getAffineTransform(pts1, pts2)
+        warped_img = cv2.warpAffine(
+            img, M, (width, height), borderMode=cv2.BORDER_REPLICATE
+        )
+        warped_mask = np.zeros((height, width, 3), dtype=np.uint8)
+        warped_mask = cv2.fillConvexPoly(warped_mask, np.int32(pts2), (1, 1, 1))
+        cv2.line(
+            warped_mask, (width_step, 0), (width_step + w - 1, height - 1), (0, 0, 0), 1
+        )
+        output_img[warped_mask == 1] = warped_img[warped_mask == 1]
+
+        width_step += w
+    return output_img
+
+
+def synthetic_image(height: int, width: int, seed: int = 0) -> np.ndarray:
+    # smooth background with some text, so small differences in the mapping only change pixels a little
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    img = np.stack([x / width * 255, y / height * 255, (x + y) / (width + height) * 255], axis=2).astype(np.uint8)
+    for _ in range(50):
+        cv2.putText(img, str(rng.integers(1, 999)), (int(rng.integers(0, width - 200)), int(rng.integers(50, height))),
+                    cv2.FONT_HERSHEY_SIMPLEX, 3, (0, 0, 0), 8)
+    return cv2.GaussianBlur(img, (7, 7), 0)
+
+
+def synthetic_polys(height: int, width: int, count: int, points: int, seed: int = 0) -> list[np.ndarray]:
+    # polygons shaped like the CRAFT output: top points left to right, bottom points right to left
+    rng = np.random.default_rng(seed)
+    polys = []
+    for _ in range(count):
+        w, h = rng.uniform(60, 400), rng.uniform(20, 80)
+        x, y = rng.uniform(0, width - w), rng.uniform(0, height - h - 20)
+        xs = np.linspace(x, x + w, points // 2)
+        bend = rng.uniform(-10, 10) * np.sin(np.linspace(0, np.pi, points // 2))
+        top = np.stack([xs, y + bend], axis=1)
+        bottom = np.stack([xs, y + h + bend], axis=1)[::-1]
+        polys.append(np.vstack([top, bottom]).astype(np.float32))
+    return polys
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compares rectify_poly with the previous implementation")
+    parser.add_argument("--height", default=4000, type=int)
+    parser.add_argument("--width", default=6000, type=int)
+    parser.add_argument("--polys", default=30, type=int)
+    args = parser.parse_args()
+
+    img = synthetic_image(args.height, args.width)
+    for points in [4, 8, 14]:
+        polys = synthetic_polys(args.height, args.width, args.polys, points)
+        timings = {}
+        for name, fn in [("reference", rectify_poly_reference), ("rectify_poly", rectify_poly)]:
+            t0 = time.perf_counter()
+            for poly in polys:
+                fn(img, poly)
+            timings[name] = (time.perf_counter() - t0) / len(polys) * 1000
+        print("{:2d} points: reference {:8.3f} ms, rectify_poly {:8.3f} ms per polygon ({:.1f}x)".format(
+            points, timings["reference"], timings["rectify_poly"], timings["reference"] / timings["rectify_poly"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 import argparse
 import datetime
+import json
 import logging
 import os.path
 import sys
@@ -7,13 +8,57 @@ import threading
 import time
 import warnings
 import globals
+import metrics
 import numpy as np
 
+from detection import backends
+from detection.ArtifactWriter import ArtifactLevel
 from detection.BibNumberDetector import BibNumberDetector
+from detection.ProcessPoolDetector import ProcessPoolDetector
+from detection.RegionFilter import RegionFilter
+from detection.ResultCache import ResultCache
+from detection.image_utils import iter_image_files
+from detection.service.IndexedBibNumberService import IndexedBibNumberService
 
 warnings.filterwarnings("ignore", category=np.VisibleDeprecationWarning)
 
 
+def stream(detector, img_paths: list[str], jsonl: str, recursive: bool, patterns: list[str] | None,
+           resume: bool) -> None:
+    # writes every result as soon as it is done, in completion order, nothing is collected in memory
+    # except the names of the images already in the output when resuming
+    done = set()
+    if resume and os.path.exists(jsonl):
+        with open(jsonl, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)["image"])
+                except (ValueError, KeyError):
+                    # the last line is cut off if the previous run was killed while writing it
+                    continue
+        logging.info("Resuming, {} images are already done".format(len(done)))
+    files = (f for f in iter_image_files(img_paths, recursive, patterns) if os.path.normpath(f) not in done)
+
+    out = sys.stdout if jsonl == "-" else open(jsonl, "a", encoding="utf-8")
+    try:
+        if out is not sys.stdout and out.tell() > 0:
+            with open(jsonl, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    out.write("\n")
+        count = 0
+        t0 = time.time()
+        for path, bibs in detector.iter_detect(files):
+            out.write(json.dumps({"image": path, "bibs": bibs}) + "\n")
+            out.flush()
+            count += 1
+            if count % 100 == 0:
+                logging.info("{} images done, {:.2f} images/sec".format(count, count / (time.time() - t0)))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
 def main():
     if not os.path.exists("logs"):
         os.mkdir("logs")
@@ -28,40 +73,145 @@ def main():
             raise argparse.ArgumentTypeError("Thread count must be less than or equal 10")
         return x
 
+    def positive(x):
+        x = int(x)
+        if x < 1:
+            raise argparse.ArgumentTypeError("Value must be greater than 0")
+        return x
+
     # parse arguments
     parser = argparse.ArgumentParser()
     parser.add_argument("-o", "--out", help="path to output directory", default="./out")
     parser.add_argument("imgs", help="path to input image(s)", nargs="+")
     parser.add_argument("-t", "--threads", help="number of threads 1 <= t <= 10", default=1, type=num_range)
+    parser.add_argument("-m", "--mode", help="run the detection in threads or in separate processes",
+                        default="thread", choices=["thread", "process"])
+    parser.add_argument("-w", "--workers", help="number of worker processes in process mode",
+                        default=os.cpu_count(), type=positive)
+    parser.add_argument("--torch-threads", help="number of torch threads per worker process", default=1,
+                        type=positive)
+    parser.add_argument("--chunk-size", help="number of images handed to a worker process at once", default=4,
+                        type=positive)
+    parser.add_argument("-b", "--batch-size", help="number of images per CRAFT forward pass", default=1,
+                        type=positive)
+    parser.add_argument("--max-wait", help="seconds to wait for a CRAFT batch to fill up", default=0.05,
+                        type=float)
+    parser.add_argument("--cache", help="path to a result cache, images processed before are not detected again")
+    parser.add_argument("--cache-size", help="maximum number of cached results", default=100000, type=positive)
+    parser.add_argument("--no-region-filter", help="send every detected text region to OCR", action="store_true")
+    parser.add_argument("--min-region-score", help="minimum mean CRAFT text score of a region sent to OCR",
+                        default=0.0, type=float)
+    parser.add_argument("--long-size", help="length in pixels of the longer image side for text detection",
+                        default=1280, type=positive)
+    parser.add_argument("--coarse-long-size", help="find text regions at this resolution first and only detect "
+                                                   "those at --long-size", type=positive)
+    parser.add_argument("--text-threshold", help="CRAFT text confidence threshold", default=0.7, type=float)
+    parser.add_argument("--link-threshold", help="CRAFT link confidence threshold", default=0.4, type=float)
+    parser.add_argument("--low-text", help="CRAFT text low-bound score", default=0.4, type=float)
+    parser.add_argument("--backend", help="inference backend of CRAFT, onnx-int8 is the fastest on CPUs but may "
+                                          "find slightly different regions", default="torch",
+                        choices=backends.BACKENDS)
+    parser.add_argument("--burst-distance", help="treat an image whose hash differs in at most this many of 256 bits "
+                                                 "from a recent image as the same burst and only read the regions "
+                                                 "found there again, e.g. 8", type=int)
+    parser.add_argument("--burst-depth", help="shots of a burst in a row that reuse the regions before CRAFT runs "
+                                              "again", default=3, type=positive)
+    parser.add_argument("--time-budget", help="seconds per image after which no more text regions are read, the "
+                                              "regions are read best first and the result is marked partial",
+                        type=float)
+    parser.add_argument("--max-bibs", help="stop reading the text regions of an image once this many bib numbers "
+                                           "were found", type=positive)
+    parser.add_argument("--bibs", help="csv file with the registered bib numbers in the first column, "
+                                       "reloaded when it changes")
+    parser.add_argument("--fuzzy-bibs", help="correct single digits OCR commonly confuses (1/7, 5/6, 0/8) "
+                                             "if that gives exactly one registered bib number", action="store_true")
+    parser.add_argument("--artifacts", help="what is written to the output directory: nothing, one results.jsonl "
+                                            "line per image, also the crops sent to OCR or also the CRAFT heatmaps",
+                        default="summary", choices=["none", "summary", "crops", "full"])
+    parser.add_argument("--metrics-json", help="write counters and stage timings to this json file at the end")
+    parser.add_argument("--profile", help="write a cProfile profile per image to this directory, only one image "
+                                          "is profiled at a time, use --threads 1 to profile every image")
+    parser.add_argument("--jsonl", help="stream one json line per image to this file (stdout without a file) as soon "
+                                        "as the image is done, directories are read lazily", nargs="?", const="-")
+    parser.add_argument("-r", "--recursive", help="with --jsonl also detect the images in subdirectories",
+                        action="store_true")
+    parser.add_argument("--glob", help="with --jsonl only detect the files of the directories matching this pattern, "
+                                       "e.g. '*.jpg', can be given more than once", action="append")
+    parser.add_argument("--resume", help="skip the images already in the --jsonl file", action="store_true")
     parser.add_argument("-log", "--log", help="log level", default="info",
                         choices=["debug", "info", "warning", "error", "critical"])
     parser.description = "Parses a given image and outputs the detected bib numbers"
 
     args = parser.parse_args()
+    if args.resume and args.jsonl in [None, "-"]:
+        parser.error("--resume needs a --jsonl file")
     globals.LOG_LEVEL = getattr(logging, args.log.upper())
     logging.basicConfig(level=globals.LOG_LEVEL, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
                         datefmt='%d-%b-%y %H:%M:%S',
                         filename=logging_file_name, filemode='w')
-    logging.getLogger().addHandler(logging.StreamHandler(sys.stdout))
+    # stdout belongs to the results when they are streamed there
+    logging.getLogger().addHandler(logging.StreamHandler(sys.stderr if args.jsonl == "-" else sys.stdout))
 
     IMG_PATHS = args.imgs
     OUT_PATH = args.out
     NUM_THREADS = args.threads
 
+    region_filter = RegionFilter(min_score=args.min_region_score)
+    if args.metrics_json is not None:
+        metrics.enable()
+    detection_args = dict(ARTIFACTS=ArtifactLevel[args.artifacts.upper()], PROFILE_DIR=args.profile,
+                          LONG_SIZE=args.long_size, COARSE_LONG_SIZE=args.coarse_long_size,
+                          TEXT_THRESHOLD=args.text_threshold, LINK_THRESHOLD=args.link_threshold,
+                          LOW_TEXT=args.low_text, BURST_DISTANCE=args.burst_distance, BURST_DEPTH=args.burst_depth,
+                          BACKEND=args.backend, FILTER_REGIONS=not args.no_region_filter,
+                          TIME_BUDGET=args.time_budget, MAX_BIBS=args.max_bibs)
+    bib_number_svc = None
+    if args.bibs is not None:
+        bib_number_svc = IndexedBibNumberService.from_csv(args.bibs, args.fuzzy_bibs)
+
     startTime = time.time()
-    with BibNumberDetector(OUT_PATH, NUM_THREADS) as detector:
+    cache = None
+    if args.mode == "process":
+        detector = ProcessPoolDetector(OUT_PATH, args.workers, args.torch_threads, args.chunk_size, args.cache,
+                                       args.cache_size, BATCH_SIZE=args.batch_size, MAX_WAIT=args.max_wait,
+                                       REGION_FILTER=region_filter, BIB_NUMBER_SVC=bib_number_svc, **detection_args)
+    else:
+        if args.cache is not None:
+            cache = ResultCache(args.cache, args.cache_size)
+        detector = BibNumberDetector(OUT_PATH, NUM_THREADS, args.batch_size, args.max_wait, cache, region_filter,
+                                     BIB_NUMBER_SVC=bib_number_svc, **detection_args)
+    with detector:
+        img_paths = []
         for img_path in IMG_PATHS:
             if not os.path.exists(img_path):
                 logging.error("Image path does not exist: {}".format(img_path))
                 continue
-            detector.detect_bib_numbers(img_path)
+            img_paths.append(img_path)
+        if args.jsonl is not None:
+            stream(detector, img_paths, args.jsonl, args.recursive, args.glob, args.resume)
+        else:
+            for img_path in img_paths:
+                detector.detect_bib_numbers(img_path)
         for t in threading.enumerate():
-            if t is not threading.current_thread():
+            # the background threads of the detector are stopped when it is closed
+            if t is not threading.current_thread() and not t.daemon:
                 t.join()  # wait for all threads to finish
         logging.info(
-            f"Processed {detector.img_counter} images with {detector.img_with_bibs_ctr} images where at least 1 bib number was found ({detector.img_with_bibs_ctr / detector.img_counter * 100}%)")
+            f"Processed {detector.img_counter} images with {detector.img_with_bibs_ctr} images where at least 1 bib number was found ({detector.img_with_bibs_ctr / max(detector.img_counter, 1) * 100}%)")
+        if args.cache is not None:
+            logging.info(f"Cache hits: {detector.cache_hits} of {detector.img_counter} images")
+        logging.info(f"Filtered {detector.regions_filtered} of {detector.regions_total} text regions before OCR")
+        if args.burst_distance is not None:
+            logging.info(f"Reused the regions of a previous burst shot for {detector.frames_reused} images")
+        if args.time_budget is not None:
+            logging.info(f"Time budget used up before all regions were read for {detector.partial_images} images")
+    if cache is not None:
+        cache.close()
+    if args.metrics_json is not None:
+        with open(args.metrics_json, "w") as f:
+            json.dump(metrics.REGISTRY.summary(), f, indent=2)
     logging.info(
-        f"Total time: {datetime.timedelta(seconds=time.time() - startTime)}s with average of {datetime.timedelta(seconds=(time.time() - startTime) / detector.img_counter)}s per image")
+        f"Total time: {datetime.timedelta(seconds=time.time() - startTime)}s with average of {datetime.timedelta(seconds=(time.time() - startTime) / max(detector.img_counter, 1))}s per image")
 
 
 if __name__ == '__main__':
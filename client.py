@@ -1,14 +1,36 @@
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
 
+import metrics
 from result import Result
 
 
 class ApiClient:
-    def __init__(self, url: str, user: str, password: str):
+    def __init__(self, url: str, user: str, password: str, timeout: float = 30):
         (self.url, self.auth) = (url, (user, password))
+        self.timeout = timeout
+        # one session keeps the connection to the API open between uploads
+        self.session = requests.Session()
+        self.session.auth = self.auth
+        self.session.headers["Content-Type"] = "text/csv; charset=utf-8"
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=2))
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=2))
 
     def send(self, pending: [int]) -> bool:
         data = Result.header+"\n"+"\n".join(pending)
-        response = requests.post(self.url, data=data.encode("utf-8"), auth=self.auth,
-                                 headers={"Content-Type": "text/csv; charset=utf-8"})
+        t0 = time.perf_counter()
+        try:
+            response = self.session.post(self.url, data=data.encode("utf-8"), timeout=self.timeout)
+        except requests.RequestException:
+            metrics.API_UPLOAD_FAILURES.inc()
+            raise
+        finally:
+            metrics.API_UPLOAD_SECONDS.observe(time.perf_counter() - t0)
+        if response.status_code//100 != 2:
+            metrics.API_UPLOAD_FAILURES.inc()
         return response.status_code//100 == 2
+
+    def close(self) -> None:
+        self.session.close()
@@ -0,0 +1,105 @@
+import json
+import logging
+import os
+import threading
+from enum import IntEnum
+from queue import Queue
+
+import cv2
+import numpy as np
+
+
+class ArtifactLevel(IntEnum):
+    NONE = 0
+    # one line per image in results.jsonl
+    SUMMARY = 1
+    # the rectified crops sent to OCR
+    CROPS = 2
+    # heatmaps and polygon overlays of CRAFT
+    FULL = 3
+
+
+class ArtifactWriter:
+    # writes the per image artifacts on a background thread, so slow output shares do not hold back the
+    # detection, the queue is bounded and blocks the detection once the writer falls QUEUE_SIZE images behind
+
+    def __init__(self, OUT_PATH: str, LEVEL: ArtifactLevel = ArtifactLevel.SUMMARY, QUEUE_SIZE: int = 64,
+                 RESULTS_FILE: str = "results.jsonl"):
+        self.OUT_PATH = OUT_PATH
+        self.LEVEL = LEVEL
+        self.queue: Queue = Queue(maxsize=QUEUE_SIZE)
+        self.results = None
+        self.worker = None
+        if LEVEL > ArtifactLevel.NONE:
+            self.results = open(os.path.join(OUT_PATH, RESULTS_FILE), "a", encoding="utf-8")
+            self.worker = threading.Thread(target=self.__run, name="artifact-writer", daemon=True)
+            self.worker.start()
+
+    def wants(self, level: ArtifactLevel) -> bool:
+        return self.LEVEL >= level
+
+    def summary(self, image: str, record: dict, cached: bool) -> None:
+        if self.wants(ArtifactLevel.SUMMARY):
+            self.queue.put((self.__write_summary, (image, record["bibs"], record["texts"], cached,
+                                                   record.get("partial", False))))
+
+    def regions(self, name: str, crops: list[np.ndarray | None], image_rgb: np.ndarray | None,
+                prediction: dict | None) -> None:
+        # the arrays are handed over to the writer, the caller must not change them afterwards,
+        # without a CRAFT prediction only the crops are written
+        if self.wants(ArtifactLevel.CROPS):
+            self.queue.put((self.__write_crops, (name, crops)))
+        if self.wants(ArtifactLevel.FULL) and prediction is not None:
+            self.queue.put((self.__write_full, (name, image_rgb, prediction["polys"], prediction["heatmaps"])))
+
+    def __run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            fn, args = item
+            try:
+                fn(*args)
+            except Exception as e:
+                logging.error("Could not write artifacts: {}".format(e))
+            if self.queue.empty():
+                self.results.flush()
+            self.queue.task_done()
+        self.results.close()
+        self.queue.task_done()
+
+    def __write_summary(self, image: str, bibs: list[int], texts: list[str], cached: bool, partial: bool):
+        line = {"image": image, "bibs": bibs, "texts": texts, "cached": cached}
+        # only images cut short by the time budget are marked
+        if partial:
+            line["partial"] = True
+        self.results.write(json.dumps(line) + "\n")
+
+    def __output_dir(self, name: str) -> str:
+        output_dir = os.path.join(self.OUT_PATH, name)
+        os.makedirs(output_dir, exist_ok=True)
+        return output_dir
+
+    def __write_crops(self, name: str, crops: list[np.ndarray | None]):
+        crops_dir = os.path.join(self.__output_dir(name), os.path.splitext(name)[0] + "_crops")
+        os.makedirs(crops_dir, exist_ok=True)
+        for i, crop in enumerate(crops):
+            if crop is not None:
+                cv2.imwrite(os.path.join(crops_dir, "crop_{}.png".format(i)), crop)
+
+    def __write_full(self, name: str, image_rgb: np.ndarray, polys: list, heatmaps: dict):
+        # only needed at the FULL level, export_extra_results draws the polygons onto the array it is given
+        from craft_text_detector import export_extra_results
+        export_extra_results(image=image_rgb, regions=polys, heatmaps=heatmaps,
+                             file_name=os.path.splitext(name)[0], output_dir=self.__output_dir(name))
+
+    def flush(self):
+        # blocks until everything queued so far is written
+        if self.worker is not None:
+            self.queue.join()
+
+    def close(self):
+        if self.worker is not None:
+            self.queue.put(None)
+            self.worker.join()
+            self.worker = None
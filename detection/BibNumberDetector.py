@@ -1,42 +1,104 @@
+import json
 import logging
 import os
 import sys
 import threading
 import time
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator
 
 import cv2
 import numpy as np
-import pytesseract
-from craft_text_detector import (
-    load_craftnet_model,
-    load_refinenet_model,
-    get_prediction,
-    export_detected_regions,
-    export_extra_results,
-    empty_cuda_cache
-)
+from craft_text_detector import empty_cuda_cache
 
+from detection.ArtifactWriter import ArtifactLevel, ArtifactWriter
+from detection.CraftBatcher import CraftBatcher
+from detection.FrameIndex import FrameIndex, dhash
+from detection.RegionFilter import RegionFilter, rank_regions
+from detection.ResultCache import ResultCache
+from detection.TesseractOcr import TesseractOcr
+from detection.TwoStagePredictor import TwoStagePredictor
+from detection.image_utils import ImageSource, list_image_files, load_image, read_image_bytes
+from detection.rectify import rectify_poly
 from detection.service.MockBibNumberService import MockBibNumberService
 from detection.service.interface.IBibNumberService import IBibNumberService
-import globals
+import metrics
 
 
 class BibNumberDetector:
-    def __init__(self, OUT_PATH: str, NUM_THREADS: int = 1):
+    def __init__(self, OUT_PATH: str, NUM_THREADS: int = 1, BATCH_SIZE: int = 1, MAX_WAIT: float = 0.05,
+                 CACHE: ResultCache | None = None, REGION_FILTER: RegionFilter | None = None,
+                 NUMERIC_ONLY: bool = True, BIB_NUMBER_SVC: IBibNumberService | None = None,
+                 LONG_SIZE: int = 1280, COARSE_LONG_SIZE: int | None = None, TEXT_THRESHOLD: float = 0.7,
+                 LINK_THRESHOLD: float = 0.4, LOW_TEXT: float = 0.4, PROFILE_DIR: str | None = None,
+                 ARTIFACTS: ArtifactLevel = ArtifactLevel.NONE, RESULTS_FILE: str = "results.jsonl",
+                 BURST_DISTANCE: int | None = None, BACKEND: str = "torch", CUDA: bool = False,
+                 TIME_BUDGET: float | None = None, MAX_BIBS: int | None = None, OCR_CHUNK: int = 4,
+                 BURST_DEPTH: int = 3, FILTER_REGIONS: bool = True):
         self.threadLock = threading.Lock()
         self.img_with_bibs_ctr = 0
         self.img_counter = 0
         self.img_count_all = -1
         self.__TESSERACT_CONFIG__ = "--psm 13"
+        if NUMERIC_ONLY:
+            # bib numbers only consist of digits, letters are never a valid result
+            self.__TESSERACT_CONFIG__ += " -c tessedit_char_whitelist=0123456789"
+        self.__MIN_CROP_HEIGHT__ = 8
+        self.__MIN_CROP_WIDTH__ = 8
         self.NUM_THREADS = NUM_THREADS
+        # text regions are filtered before OCR with REGION_FILTER or a default RegionFilter unless FILTER_REGIONS is
+        # False, a new default per detector so no filter state is shared between them
+        if not FILTER_REGIONS:
+            REGION_FILTER = None
+        elif REGION_FILTER is None:
+            REGION_FILTER = RegionFilter()
+        self.region_filter = REGION_FILTER
+        self.regions_total = 0
+        self.regions_filtered = 0
+        self.ocr = TesseractOcr(self.__TESSERACT_CONFIG__)
+        # with TIME_BUDGET (seconds per image) or MAX_BIBS the regions are read best first in chunks of OCR_CHUNK,
+        # reading stops when the budget is used up (the result is partial) or once MAX_BIBS different bib numbers
+        # were found, chunks are cut to the number of bib numbers still missing so no region is read in vain
+        self.TIME_BUDGET = TIME_BUDGET
+        self.MAX_BIBS = MAX_BIBS
+        self.OCR_CHUNK = OCR_CHUNK
+        self.partial_images = 0
 
         self.__supported_image_formats__ = ["jpg", "jpeg", "png", "tif", "tiff", "bmp", "dib", "webp"]
 
-        self.refine_net = load_refinenet_model()
-        self.craft_net = load_craftnet_model()
+        # the CRAFT models of BACKEND are loaded on the first image and shared by all detectors of the process
+        # images of concurrent calls are collected into batches of up to BATCH_SIZE for one CRAFT forward pass
+        self.BATCH_SIZE = BATCH_SIZE
+        prediction_args = dict(text_threshold=TEXT_THRESHOLD, link_threshold=LINK_THRESHOLD, low_text=LOW_TEXT,
+                               long_size=LONG_SIZE)
+        self.batcher = CraftBatcher(BACKEND, CUDA, BATCH_SIZE, MAX_WAIT, **prediction_args)
+        # with COARSE_LONG_SIZE only the regions found by a low resolution pass are detected at LONG_SIZE
+        self.predictor = self.batcher
+        if COARSE_LONG_SIZE is not None and COARSE_LONG_SIZE < LONG_SIZE:
+            self.predictor = TwoStagePredictor(self.batcher, LONG_SIZE, COARSE_LONG_SIZE)
 
-        self.bib_number_svc: IBibNumberService = MockBibNumberService()
+        # cached results are only valid for the configuration they were computed with
+        self.cache = CACHE
+        self.cache_hits = 0
+        self.__cache_config = json.dumps(dict(prediction_args, backend=BACKEND, tesseract=self.__TESSERACT_CONFIG__,
+                                              coarse_long_size=getattr(self.predictor, "COARSE_LONG_SIZE", None),
+                                              max_bibs=MAX_BIBS,
+                                              min_crop=[self.__MIN_CROP_HEIGHT__, self.__MIN_CROP_WIDTH__],
+                                              region_filter=REGION_FILTER.config() if REGION_FILTER else None),
+                                         sort_keys=True)
+
+        self.bib_number_svc: IBibNumberService = BIB_NUMBER_SVC or MockBibNumberService()
+        # with BURST_DISTANCE an image whose hash differs in at most that many bits from a recent one is treated
+        # as a shot of the same burst, only the regions found in that shot are read again
+        self.frame_index = FrameIndex(max_distance=BURST_DISTANCE) if BURST_DISTANCE is not None else None
+        # at most BURST_DEPTH shots in a row reuse the regions of the shot CRAFT ran on, then CRAFT runs again so
+        # runners who entered the frame in the meantime are found
+        self.BURST_DEPTH = BURST_DEPTH
+        self.frames_reused = 0
+        self.timing_listeners: list[Callable[[str, dict[str, float]], None]] = []
+        self.record_listeners: list[Callable[[str, np.ndarray | None, dict], None]] = []
+        # with PROFILE_DIR every image is run under cProfile and its profile is written there
+        self.profiler = metrics.Profiler(PROFILE_DIR) if PROFILE_DIR is not None else None
 
         if not os.path.exists(OUT_PATH):
             os.makedirs(OUT_PATH)
@@ -44,10 +106,21 @@ class BibNumberDetector:
             logging.fatal("Output path is not a directory: {}".format(OUT_PATH))
             sys.exit(-1)
         self.OUT_PATH = OUT_PATH
+        # results.jsonl, crops and CRAFT exports are written in the background and only as far as ARTIFACTS asks
+        self.artifacts = ArtifactWriter(OUT_PATH, ARTIFACTS, RESULTS_FILE=RESULTS_FILE)
 
     def __enter__(self):
         return self
 
+    def add_timing_listener(self, listener: Callable[[str, dict[str, float]], None]):
+        # listener(name, timings) is called after every image with the seconds spent in each stage
+        self.timing_listeners.append(listener)
+
+    def add_record_listener(self, listener: Callable[[str, np.ndarray | None, dict], None]):
+        # listener(name, image, record) is called with the record of every image before it is returned, image is
+        # the decoded BGR image or None if the record came from the cache
+        self.record_listeners.append(listener)
+
     def detect_bib_numbers(self, img_path) -> dict[str, list[int]]:
         ret: dict[str, list[int]] = {}
         return self._detect_bib_numbers(img_path, ret)
@@ -55,15 +128,10 @@ class BibNumberDetector:
     def _detect_bib_numbers(self, img_path, ret: dict[str, list[int]]) -> dict[str, list[int]]:
         try:
             if type(img_path) == list or os.path.isdir(img_path):
-
-                img_files = img_path or [os.path.join(img_path, img_file) for img_file in os.listdir(img_path)]
+                img_files = list_image_files(img_path)
                 self.img_count_all = len(img_files)
-                with ThreadPoolExecutor(max_workers=self.NUM_THREADS) as executor:
-                    futures = [executor.submit(self._detect_bib_numbers,img_file, ret) for
-                               img_file in img_files]
-                    for f in futures:
-                        ret.update(f.result())
-
+                for path, bibs in self.iter_detect(img_files):
+                    ret[path] = bibs
             else:
                 ret[os.path.normpath(img_path)] = self.detect_bib_numbers_single(img_path)
         except Exception as e:
@@ -71,140 +139,285 @@ class BibNumberDetector:
             logging.error("FATAL: Could not process img_path: {}".format(img_path))
         return ret
 
-    def detect_bib_numbers_single(self, img_path: str) -> list[int] | None:
-        if img_path.split(".")[-1] not in self.__supported_image_formats__:
-            logging.warning("Image format not supported: {}".format(img_path))
-            return None
-        output_dir = os.path.join(self.OUT_PATH, os.path.basename(img_path))
+    def iter_detect(self, img_files: Iterable[str]) -> Iterator[tuple[str, list[int] | None]]:
+        # yields the results in completion order, img_files is consumed lazily and only twice the number of
+        # workers is in flight, so memory does not grow with the number of images
+        # keeps at least BATCH_SIZE images in flight so the batches of the CRAFT stage can fill up
+        workers = max(self.NUM_THREADS, self.BATCH_SIZE)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures: dict[Future, str] = {}
+            for img_file in img_files:
+                if len(futures) >= 2 * workers:
+                    yield from self.__completed(futures, wait(futures, return_when=FIRST_COMPLETED).done)
+                futures[executor.submit(self.detect_bib_numbers_single, img_file)] = img_file
+            while len(futures) > 0:
+                yield from self.__completed(futures, wait(futures, return_when=FIRST_COMPLETED).done)
+
+    @staticmethod
+    def __completed(futures: dict[Future, str], done: set[Future]) -> Iterator[tuple[str, list[int] | None]]:
+        for f in done:
+            img_file = futures.pop(f)
+            try:
+                yield os.path.normpath(img_file), f.result()
+            except Exception as e:
+                logging.error(e)
+                logging.error("FATAL: Could not process img_path: {}".format(img_file))
+
+    def detect_bib_numbers_single(self, image: ImageSource, name: str | None = None) -> list[int] | None:
+        record = self.detect_image(image, name)
+        return None if record is None else record["bibs"]
+
+    def detect_image(self, image: ImageSource, name: str | None = None) -> dict | None:
+        # returns the detected polygons, the raw OCR texts and the validated bib numbers of the image
+        if self.profiler is not None:
+            return self.profiler.run(name or (image if type(image) == str else "image"), self.__detect_image,
+                                     image, name)
+        return self.__detect_image(image, name)
+
+    def __detect_image(self, image: ImageSource, name: str | None) -> dict | None:
+        if type(image) == str:
+            if image.split(".")[-1] not in self.__supported_image_formats__:
+                logging.warning("Image format not supported: {}".format(image))
+                return None
+            name = name or os.path.basename(image)
+            display_name = os.path.abspath(image)
+        else:
+            name = name or "image"
+            display_name = name
 
         with self.threadLock:
             self.img_counter += 1
         logging.info("Processing image{}: {}".format(
             "" if self.img_count_all == -1 else f" ({self.img_counter}/{self.img_count_all})",
-            os.path.abspath(img_path)))
-        logging.info("Output path: {}".format(os.path.abspath(output_dir)))
-        t0 = time.time()
+            display_name))
+        t_start = time.perf_counter()
+        deadline = None if self.TIME_BUDGET is None else t_start + self.TIME_BUDGET
+        timings: dict[str, float] = {}
+
+        data = read_image_bytes(image) if type(image) == str else image
+        timings["read"] = time.perf_counter() - t_start
+        record = None
+        img = None
+        cached = False
+        if self.cache is not None:
+            t0 = time.perf_counter()
+            cache_key = ResultCache.key(data, self.__cache_config)
+            record = self.cache.get(cache_key)
+            if record is not None:
+                logging.info("Using cached result")
+                cached = True
+                with self.threadLock:
+                    self.cache_hits += 1
+                # the bib number service may have changed since the result was cached
+                record["bibs"] = self.__validate(record["texts"])
+            metrics.CACHE_REQUESTS.inc(1, "miss" if record is None else "hit")
+            timings["cache"] = time.perf_counter() - t0
+        if record is None:
+            t0 = time.perf_counter()
+            img = load_image(data)
+            timings["decode"] = time.perf_counter() - t0
+            previous = None
+            if self.frame_index is not None:
+                t0 = time.perf_counter()
+                frame_hash = dhash(img)
+                previous = self.frame_index.lookup(frame_hash, img.shape)
+                if previous is not None and previous.get("burst", 0) >= self.BURST_DEPTH:
+                    previous = None
+                timings["dedup"] = time.perf_counter() - t0
+            if previous is not None:
+                logging.info("Same burst as a previous image, reading its regions again")
+                with self.threadLock:
+                    self.frames_reused += 1
+                record = self.__reuse(img, name, previous, timings, deadline)
+            else:
+                record = self.__detect(img, name, timings, deadline)
+            if self.frame_index is not None:
+                self.frame_index.add(frame_hash, img.shape, record)
+            # a partial result depends on how fast this run was and a reused one on the images before it (OCR on the
+            # regions of another shot, carried over bibs), neither is reused for the next request
+            if self.cache is not None and not record["partial"] and previous is None:
+                t0 = time.perf_counter()
+                self.cache.put(cache_key, record)
+                timings["cache"] += time.perf_counter() - t0
+        found_bibs = record["bibs"]
+        if record.get("partial"):
+            logging.info("Time budget used up, {} regions were not read".format(record["skipped"]))
+            with self.threadLock:
+                self.partial_images += 1
+            metrics.PARTIAL_IMAGES.inc()
+        if not len(found_bibs) == 0:
+            with self.threadLock:
+                self.img_with_bibs_ctr += 1
+        else:
+            logging.info("No bib numbers found")
+
+        t0 = time.perf_counter()
+        self.artifacts.summary(display_name, record, cached)
+        for listener in self.record_listeners:
+            listener(display_name, img, record)
+        timings["output"] = time.perf_counter() - t0
+        timings["total"] = time.perf_counter() - t_start
+        for listener in self.timing_listeners:
+            listener(display_name, timings)
+        if metrics.enabled():
+            metrics.IMAGES.inc()
+            for stage, seconds in timings.items():
+                metrics.STAGE_SECONDS.observe(seconds, stage)
+
+        logging.info("Processing time: {} seconds".format(timings["total"]))
+        logging.info("Done processing image{}: {}\n".format(
+            "" if self.img_count_all == -1 else f" ({self.img_counter}/{self.img_count_all})",
+            display_name))
+        return record
+
+    def __detect(self, image: np.ndarray, name: str, timings: dict[str, float], deadline: float | None) -> dict:
+        # CRAFT and the exports expect RGB while the OCR crops stay BGR
+        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
         # apply craft text detection and export detected regions to output directory
-        prediction_result = get_prediction(
-            image=img_path,
-            craft_net=self.craft_net,
-            refine_net=self.refine_net,
-            text_threshold=0.7,
-            link_threshold=0.4,
-            low_text=0.4,
-            cuda=False,
-            long_size=1280
-        )
+        t0 = time.perf_counter()
+        prediction_result = self.predictor.predict(image_rgb)
+        timings["craft"] = time.perf_counter() - t0
+        t0 = time.perf_counter()
         regions = prediction_result["polys"]
-        if type(img_path) == str:
-            file_name, file_ext = os.path.splitext(os.path.basename(img_path))
-        else:
-            file_name = "image"
-        if globals.LOG_LEVEL <= logging.INFO:
-            exported_file_paths = export_detected_regions(
-                image=img_path,
-                regions=regions,
-                file_name=file_name,
-                output_dir=output_dir,
-                rectify=True,
-            )
-        # extra results
-        if globals.LOG_LEVEL <= logging.DEBUG:
-            export_extra_results(
-                image=img_path,
-                regions=regions,
-                heatmaps=prediction_result["heatmaps"],
-                file_name=file_name,
-                output_dir=output_dir,
-            )
-        image = cv2.imread(img_path)
-
-        found_bibs: list[int] = []
-        for box in regions:
-            cropped_img = rectify_poly(image, box)
-
-            result: str = pytesseract.image_to_string(cropped_img, config=self.__TESSERACT_CONFIG__).strip()
+        keep = [True] * len(regions)
+        if self.region_filter is not None:
+            keep = self.region_filter.filter(regions, prediction_result["scores"], image.shape)
+        with self.threadLock:
+            self.regions_total += len(regions)
+            self.regions_filtered += keep.count(False)
+        logging.info("Filtered {} of {} regions before OCR".format(keep.count(False), len(regions)))
+        timings["filter"] = time.perf_counter() - t0
+
+        cropped_imgs, texts, bibs, skipped, stop = self.__read(image, regions, prediction_result["scores"], keep,
+                                                               timings, deadline)
+        t0 = time.perf_counter()
+        # only queued here, the writer owns the arrays from now on
+        self.artifacts.regions(name, cropped_imgs, image_rgb, prediction_result)
+        timings["export"] = time.perf_counter() - t0
+        return {
+            "polys": [np.asarray(box).tolist() for box in regions],
+            "scores": prediction_result["scores"],
+            "texts": texts,
+            "filtered": keep.count(False),
+            "bibs": bibs,
+            "skipped": skipped,
+            "partial": stop == "budget",
+        }
+
+    def __reuse(self, image: np.ndarray, name: str, previous: dict, timings: dict[str, float],
+                deadline: float | None) -> dict:
+        # OCR on the regions CRAFT found in the previous shot of the burst, CRAFT itself is skipped
+        regions = previous["polys"]
+        keep = [True] * len(regions)
+        if self.region_filter is not None:
+            keep = self.region_filter.filter(regions, previous["scores"], image.shape)
+        cropped_imgs, texts, bibs, skipped, stop = self.__read(image, regions, previous["scores"], keep, timings,
+                                                               deadline)
+        self.artifacts.regions(name, cropped_imgs, None, None)
+        # the runners of a burst are the same, a bib only read in the previous shot is kept. Only the bibs that shot
+        # read itself are carried over, so a bib does not stay attached to all following shots of a static camera
+        read_bibs = list(bibs)
+        carried = [b for b in previous.get("read_bibs", previous["bibs"]) if b not in bibs]
+        if self.MAX_BIBS is not None:
+            carried = carried[:max(self.MAX_BIBS - len(set(bibs)), 0)]
+        bibs += carried
+        return {
+            "polys": regions,
+            "scores": previous["scores"],
+            "texts": texts,
+            "filtered": keep.count(False),
+            "bibs": bibs,
+            "read_bibs": read_bibs,
+            "skipped": skipped,
+            "partial": stop == "budget",
+            # number of shots since CRAFT last ran on the burst
+            "burst": previous.get("burst", 0) + 1,
+        }
+
+    @staticmethod
+    def __expired(deadline: float | None) -> bool:
+        return deadline is not None and time.perf_counter() >= deadline
+
+    def __read(self, image: np.ndarray, regions: list, scores: list[float], keep: list[bool],
+               timings: dict[str, float], deadline: float | None) -> (list, list[str], list[int], int, str | None):
+        # rectifies and recognizes the kept regions, returns the crops and texts per region (None and "" for the
+        # ones not read), the validated bib numbers, the number of kept regions skipped and why reading stopped
+        # early ("budget" or "max_bibs", None if all kept regions were read)
+        candidates = [i for i, k in enumerate(keep) if k]
+        chunk = max(len(candidates), 1)
+        if self.TIME_BUDGET is not None or self.MAX_BIBS is not None:
+            candidates = rank_regions(regions, scores, image.shape, candidates)
+            chunk = self.OCR_CHUNK
+        cropped_imgs: list[np.ndarray | None] = [None] * len(regions)
+        texts = [""] * len(regions)
+        bibs: list[int] = []
+        timings["rectify"] = timings["ocr"] = timings["validate"] = 0.0
+        read = 0
+        calls = 0
+        stop = None
+        while read < len(candidates):
+            if self.__enough(bibs):
+                stop = "max_bibs"
+                break
+            # the best chunk is always read, even if CRAFT already used up the budget
+            if read > 0 and self.__expired(deadline):
+                stop = "budget"
+                break
+            size = chunk
+            if self.MAX_BIBS is not None:
+                # every region gives at most one bib number, a chunk is never larger than the numbers still missing
+                size = min(chunk, self.MAX_BIBS - len(set(bibs)))
+            part = candidates[read:read + size]
+            t0 = time.perf_counter()
+            # crops too small to contain a readable bib number are skipped (None)
+            crops = [rectify_poly(image, regions[i], self.__MIN_CROP_HEIGHT__, self.__MIN_CROP_WIDTH__) for i in part]
+            timings["rectify"] += time.perf_counter() - t0
+
+            # all crops of a chunk are recognized with one OCR call, results keep the order of the regions
+            t0 = time.perf_counter()
+            part_texts = self.ocr.images_to_strings(crops)
+            timings["ocr"] += time.perf_counter() - t0
+            calls += 1
+
+            for i, crop, text in zip(part, crops, part_texts):
+                cropped_imgs[i] = crop
+                texts[i] = text
+            read += len(part)
+
+            t0 = time.perf_counter()
+            bibs += self.__validate(part_texts)
+            timings["validate"] += time.perf_counter() - t0
+        if metrics.enabled():
+            boxes = sum(crop is not None for crop in cropped_imgs)
+            metrics.OCR_BOXES.observe(boxes)
+            metrics.OCR_CALLS.observe(calls)
+            if boxes > 0:
+                metrics.OCR_BOX_SECONDS.observe(timings["ocr"] / boxes)
+        return cropped_imgs, texts, bibs, len(candidates) - read, stop
+
+    def __enough(self, bibs: list[int]) -> bool:
+        return self.MAX_BIBS is not None and len(set(bibs)) >= self.MAX_BIBS
+
+    def __validate(self, texts: list[str]) -> list[int]:
+        numbers: list[int] = []
+        for result in texts:
             logging.debug("Detected text: {}".format(result))
             try:
-                result_number = int(result)
-                if self.bib_number_svc.find_number(int(result)) is not None:
-                    found_bibs.append(int(result))
-                    logging.info("Found bib number: {}".format(result_number))
+                numbers.append(int(result))
             except ValueError:
                 logging.debug("Could not parse bib number: {}".format(result))
-
-        with open(os.path.join(output_dir, "output.txt"), "w+") as f:
-            if not len(found_bibs) == 0:
-                with self.threadLock:
-                    self.img_with_bibs_ctr += 1
-                f.write("Found bib numbers: {}".format(found_bibs))
-            else:
-                f.write("No bib numbers found")
-                logging.info("No bib numbers found")
-
-        logging.info("Processing time: {} seconds".format(time.time() - t0))
-        logging.info("Done processing image{}: {}\n".format(
-            "" if self.img_count_all == -1 else f" ({self.img_counter}/{self.img_count_all})",
-            os.path.abspath(img_path)))
+        # all numbers of the image are validated with one lookup in the bib number service
+        found_bibs = self.bib_number_svc.find_numbers(numbers)
+        for bib in found_bibs:
+            logging.info("Found bib number: {}".format(bib))
         return found_bibs
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        empty_cuda_cache()
+        self.close()
 
-
-def rectify_poly(img, poly):
-    # Use Affine transform
-    n = int(len(poly) / 2) - 1
-    width = 0
-    height = 0
-    for k in range(n):
-        box = np.float32([poly[k], poly[k + 1], poly[-k - 2], poly[-k - 1]])
-        width += int(
-            (np.linalg.norm(box[0] - box[1]) + np.linalg.norm(box[2] - box[3])) / 2
-        )
-        height += np.linalg.norm(box[1] - box[2])
-    width = int(width)
-    height = int(height / n)
-
-    output_img = np.zeros((height, width, 3), dtype=np.uint8)
-    width_step = 0
-    for k in range(n):
-        box = np.float32([poly[k], poly[k + 1], poly[-k - 2], poly[-k - 1]])
-        w = int((np.linalg.norm(box[0] - box[1]) + np.linalg.norm(box[2] - box[3])) / 2)
-
-        # Top triangle
-        pts1 = box[:3]
-        pts2 = np.float32(
-            [[width_step, 0], [width_step + w - 1, 0], [width_step + w - 1, height - 1]]
-        )
-        M = cv2.getAffineTransform(pts1, pts2)
-        warped_img = cv2.warpAffine(
-            img, M, (width, height), borderMode=cv2.BORDER_REPLICATE
-        )
-        warped_mask = np.zeros((height, width, 3), dtype=np.uint8)
-        warped_mask = cv2.fillConvexPoly(warped_mask, np.int32(pts2), (1, 1, 1))
-        output_img[warped_mask == 1] = warped_img[warped_mask == 1]
-
-        # Bottom triangle
-        pts1 = np.vstack((box[0], box[2:]))
-        pts2 = np.float32(
-            [
-                [width_step, 0],
-                [width_step + w - 1, height - 1],
-                [width_step, height - 1],
-            ]
-        )
-        M = cv2.getAffineTransform(pts1, pts2)
-        warped_img = cv2.warpAffine(
-            img, M, (width, height), borderMode=cv2.BORDER_REPLICATE
-        )
-        warped_mask = np.zeros((height, width, 3), dtype=np.uint8)
-        warped_mask = cv2.fillConvexPoly(warped_mask, np.int32(pts2), (1, 1, 1))
-        cv2.line(
-            warped_mask, (width_step, 0), (width_step + w - 1, height - 1), (0, 0, 0), 1
-        )
-        output_img[warped_mask == 1] = warped_img[warped_mask == 1]
-
-        width_step += w
-    return output_img
+    def close(self):
+        self.batcher.close()
+        self.ocr.close()
+        self.artifacts.close()
+        empty_cuda_cache()
@@ -0,0 +1,175 @@
+import logging
+import threading
+import time
+from queue import Empty, Queue
+
+import cv2
+import numpy as np
+import craft_text_detector.craft_utils as craft_utils
+import craft_text_detector.image_utils as image_utils
+
+from detection import backends
+
+# value a zero pixel has after normalizeMeanVariance, used to pad the letterboxed images
+PAD_VALUE = image_utils.normalizeMeanVariance(np.zeros((1, 1, 3), dtype=np.float32))[0, 0]
+
+
+def get_predictions(images: list[np.ndarray], backend, text_threshold: float = 0.7, link_threshold: float = 0.4,
+                    low_text: float = 0.4, long_size: int | list[int] = 1280, poly: bool = True) -> list[dict]:
+    # batched version of craft_text_detector.get_prediction, the RGB images are letterboxed to a
+    # common size, run through CRAFT and the refiner of the backend in one forward pass and split up again,
+    # long_size can be given per image
+    t0 = time.time()
+    long_sizes = long_size if isinstance(long_size, list) else [long_size] * len(images)
+    resized = [image_utils.resize_aspect_ratio(img, size, interpolation=cv2.INTER_LINEAR)
+               for img, size in zip(images, long_sizes)]
+    height = max(r[0].shape[0] for r in resized)
+    width = max(r[0].shape[1] for r in resized)
+    batch = np.empty((len(images), height, width, 3), dtype=np.float32)
+    batch[:] = PAD_VALUE
+    for i, (img_resized, _, _) in enumerate(resized):
+        batch[i, :img_resized.shape[0], :img_resized.shape[1]] = image_utils.normalizeMeanVariance(img_resized)
+    x = np.ascontiguousarray(batch.transpose(0, 3, 1, 2))  # [b, h, w, c] to [b, c, h, w]
+    preprocessing_time = time.time() - t0
+    t0 = time.time()
+
+    score_texts, score_links = backend.forward(x)
+    # CRAFT and the refiner run as one step in every backend
+    craftnet_time = time.time() - t0
+    refinenet_time = 0.0
+
+    predictions = []
+    for i, (_, target_ratio, size_heatmap) in enumerate(resized):
+        t0 = time.time()
+        # only the part of the score maps that belongs to this image
+        score_text = score_texts[i, :size_heatmap[1], :size_heatmap[0]]
+        score_link = score_links[i, :size_heatmap[1], :size_heatmap[0]]
+        boxes, polys = craft_utils.getDetBoxes(score_text, score_link, text_threshold, link_threshold, low_text,
+                                               poly)
+        ratio = 1 / target_ratio
+        boxes = craft_utils.adjustResultCoordinates(boxes, ratio, ratio)
+        polys = craft_utils.adjustResultCoordinates(polys, ratio, ratio)
+        for k in range(len(polys)):
+            if polys[k] is None:
+                polys[k] = boxes[k]
+        predictions.append({
+            "boxes": boxes,
+            "polys": polys,
+            "scores": region_scores(score_text, polys, target_ratio / 2),
+            "heatmaps": {
+                "text_score_heatmap": image_utils.cvt2HeatmapImg(score_text),
+                "link_score_heatmap": image_utils.cvt2HeatmapImg(score_link),
+            },
+            "times": {
+                "preprocessing_time": preprocessing_time,
+                "craftnet_time": craftnet_time,
+                "refinenet_time": refinenet_time,
+                "postprocess_time": time.time() - t0,
+            },
+            "batch_size": len(images),
+        })
+    return predictions
+
+
+def region_scores(score_text: np.ndarray, polys: list, scale: float) -> list[float]:
+    # mean text score inside every polygon, scale converts image coordinates to score map coordinates
+    scores = []
+    for poly in polys:
+        pts = np.round(np.asarray(poly, dtype=np.float32).reshape(-1, 2) * scale).astype(np.int32)
+        x, y, w, h = cv2.boundingRect(pts)
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, score_text.shape[1]), min(y + h, score_text.shape[0])
+        if x1 <= x0 or y1 <= y0:
+            scores.append(0.0)
+            continue
+        mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+        cv2.fillPoly(mask, [pts - [x0, y0]], 1)
+        values = score_text[y0:y1, x0:x1][mask == 1]
+        scores.append(float(values.mean()) if values.size > 0 else 0.0)
+    return scores
+
+
+class _Request:
+    def __init__(self, image: np.ndarray, long_size: int):
+        self.image = image
+        self.long_size = long_size
+        self.done = threading.Event()
+        self.result: dict | None = None
+        self.error: Exception | None = None
+
+
+class CraftBatcher:
+    def __init__(self, BACKEND: str = "torch", CUDA: bool = False, BATCH_SIZE: int = 1, MAX_WAIT: float = 0.05,
+                 **prediction_args):
+        # the models of the backend are loaded on the first prediction and shared with the other batchers
+        self.BACKEND = BACKEND
+        self.CUDA = CUDA
+        self.BATCH_SIZE = BATCH_SIZE
+        self.MAX_WAIT = MAX_WAIT
+        self.prediction_args = prediction_args
+
+        self.queue: Queue[_Request] = Queue()
+        self.running = True
+        self.worker = None
+        if BATCH_SIZE > 1:
+            self.worker = threading.Thread(target=self.__run, name="craft-batcher", daemon=True)
+            self.worker.start()
+
+    @property
+    def backend(self):
+        return backends.get_backend(self.BACKEND, self.CUDA)
+
+    def predict(self, image: np.ndarray, long_size: int | None = None) -> dict:
+        # blocks until the batch containing this image went through the network,
+        # long_size overrides the configured detection resolution for this image
+        long_size = long_size or self.prediction_args.get("long_size", 1280)
+        if self.worker is None:
+            return self.predict_batch([image], [long_size])[0]
+        request = _Request(image, long_size)
+        self.queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def predict_batch(self, images: list[np.ndarray], long_sizes: list[int] | None = None) -> list[dict]:
+        args = dict(self.prediction_args)
+        ret = []
+        for i in range(0, len(images), self.BATCH_SIZE):
+            if long_sizes is not None:
+                args["long_size"] = long_sizes[i:i + self.BATCH_SIZE]
+            ret += get_predictions(images[i:i + self.BATCH_SIZE], self.backend, **args)
+        return ret
+
+    def __run(self):
+        while self.running:
+            try:
+                batch = [self.queue.get(timeout=0.5)]
+            except Empty:
+                continue
+            # wait at most MAX_WAIT for the batch to fill up, so single live images are not held back
+            deadline = time.time() + self.MAX_WAIT
+            while len(batch) < self.BATCH_SIZE:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except Empty:
+                    break
+            try:
+                results = get_predictions([r.image for r in batch], self.backend,
+                                          **dict(self.prediction_args, long_size=[r.long_size for r in batch]))
+                for request, result in zip(batch, results):
+                    request.result = result
+            except Exception as e:
+                logging.error("Batched text detection failed: {}".format(e))
+                for request in batch:
+                    request.error = e
+            for request in batch:
+                request.done.set()
+
+    def close(self):
+        self.running = False
+        if self.worker is not None:
+            self.worker.join()
@@ -0,0 +1,39 @@
+import threading
+from collections import deque
+
+import cv2
+import numpy as np
+
+
+def dhash(image: np.ndarray, hash_size: int = 16) -> int:
+    # difference hash: one bit per horizontally neighbouring pixel pair of the downscaled grayscale image,
+    # near identical frames (bursts) differ in only a few bits
+    gray = image if len(image.shape) == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class FrameIndex:
+    # the hashes and detection records of the last max_frames images, a new image closer than max_distance bits
+    # to one of them is considered a shot of the same burst
+
+    def __init__(self, max_frames: int = 32, max_distance: int = 8):
+        self.max_distance = max_distance
+        self.frames: deque[tuple[int, tuple, dict]] = deque(maxlen=max_frames)
+        self.lock = threading.Lock()
+
+    def lookup(self, frame_hash: int, shape: tuple) -> dict | None:
+        # record of the closest previous frame of the same size, None if there is none close enough,
+        # of equally close frames the most recent one
+        best, best_distance = None, self.max_distance + 1
+        with self.lock:
+            for h, s, record in reversed(self.frames):
+                distance = (h ^ frame_hash).bit_count()
+                if s == shape and distance < best_distance:
+                    best, best_distance = record, distance
+        return best
+
+    def add(self, frame_hash: int, shape: tuple, record: dict) -> None:
+        with self.lock:
+            self.frames.append((frame_hash, shape, record))
@@ -0,0 +1,132 @@
+import logging
+import os
+import shutil
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Iterable, Iterator
+
+import torch
+
+from detection.BibNumberDetector import BibNumberDetector
+from detection.ResultCache import ResultCache
+from detection.image_utils import list_image_files
+import globals
+import metrics
+
+# one detector (and thus one set of CRAFT models) per worker process
+_detector: BibNumberDetector | None = None
+
+
+# counters of the detectors in the workers which are summed up in the parent
+STATS = ["cache_hits", "regions_total", "regions_filtered", "frames_reused", "partial_images"]
+
+
+def _init_worker(out_path: str, torch_threads: int, cache_path: str | None, cache_size: int, log_level: int,
+                 metrics_enabled: bool, detector_args: dict):
+    global _detector
+    globals.LOG_LEVEL = log_level
+    metrics.enable(metrics_enabled)
+    if not logging.getLogger().hasHandlers():
+        logging.basicConfig(level=log_level, format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s',
+                            datefmt='%d-%b-%y %H:%M:%S')
+    # without pinning every worker would start one intra-op thread per core
+    torch.set_num_threads(torch_threads)
+    # every worker opens its own connection, sqlite serializes the writes to the shared file
+    cache = ResultCache(cache_path, cache_size) if cache_path is not None else None
+    # every worker writes its own part of results.jsonl, the parts are joined when the pool is closed
+    detector_args = dict(detector_args, RESULTS_FILE="results.{}.jsonl.part".format(os.getpid()))
+    _detector = BibNumberDetector(out_path, 1, CACHE=cache, **detector_args)
+
+
+def _detect_chunk(img_files: list[str]) -> tuple[list[tuple[str, list[int] | None]], dict[str, int], dict]:
+    before = {stat: getattr(_detector, stat) for stat in STATS}
+    results = list(_detector.iter_detect(img_files))
+    # the worker may be stopped after any chunk, nothing of it may still be queued then
+    _detector.artifacts.flush()
+    # the metrics recorded in the worker are merged into the registry of the parent
+    return results, {stat: getattr(_detector, stat) - before[stat] for stat in STATS}, metrics.REGISTRY.drain()
+
+
+def _chunks(img_files: Iterable[str], size: int) -> Iterator[list[str]]:
+    chunk = []
+    for f in img_files:
+        chunk.append(f)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+class ProcessPoolDetector:
+    def __init__(self, OUT_PATH: str, NUM_WORKERS: int = os.cpu_count(), TORCH_THREADS: int = 1,
+                 CHUNK_SIZE: int = 4, CACHE_PATH: str | None = None, CACHE_SIZE: int = 100000, **DETECTOR_ARGS):
+        # DETECTOR_ARGS are passed on to the BibNumberDetector of every worker
+        self.img_with_bibs_ctr = 0
+        self.img_counter = 0
+        self.img_count_all = -1
+        for stat in STATS:
+            setattr(self, stat, 0)
+        self.CHUNK_SIZE = CHUNK_SIZE
+        self.NUM_WORKERS = NUM_WORKERS
+
+        if not os.path.exists(OUT_PATH):
+            os.makedirs(OUT_PATH)
+        self.OUT_PATH = OUT_PATH
+        self.executor = ProcessPoolExecutor(max_workers=NUM_WORKERS, initializer=_init_worker,
+                                            initargs=(OUT_PATH, TORCH_THREADS, CACHE_PATH, CACHE_SIZE, globals.LOG_LEVEL,
+                                                      metrics.enabled(),
+                                                      DETECTOR_ARGS))
+
+    def __enter__(self):
+        return self
+
+    def detect_bib_numbers(self, img_path) -> dict[str, list[int]]:
+        ret: dict[str, list[int]] = {}
+        img_files = list_image_files(img_path)
+        self.img_count_all = len(img_files)
+        for path, bibs in self.iter_detect(img_files):
+            ret[path] = bibs
+        return ret
+
+    def iter_detect(self, img_files: Iterable[str]) -> Iterator[tuple[str, list[int] | None]]:
+        # chunks are collected as soon as they are done, in whichever order the workers finish,
+        # img_files is consumed lazily with at most two chunks per worker in flight
+        futures = set()
+        for chunk in _chunks(img_files, self.CHUNK_SIZE):
+            if len(futures) >= 2 * self.NUM_WORKERS:
+                finished, futures = wait(futures, return_when=FIRST_COMPLETED)
+                yield from self.__collect(finished)
+            futures.add(self.executor.submit(_detect_chunk, chunk))
+        while len(futures) > 0:
+            finished, futures = wait(futures, return_when=FIRST_COMPLETED)
+            yield from self.__collect(finished)
+
+    def __collect(self, finished: set[Future]) -> Iterator[tuple[str, list[int] | None]]:
+        for f in finished:
+            try:
+                results, stats, drained = f.result()
+            except Exception as e:
+                logging.error(e)
+                logging.error("FATAL: Worker process failed")
+                continue
+            for stat in STATS:
+                setattr(self, stat, getattr(self, stat) + stats[stat])
+            metrics.REGISTRY.merge(drained)
+            for path, bibs in results:
+                if bibs is not None:
+                    self.img_counter += 1
+                    if len(bibs) > 0:
+                        self.img_with_bibs_ctr += 1
+                yield path, bibs
+            logging.info("Processed {} images".format(self.img_counter) if self.img_count_all == -1 else
+                         "Processed {}/{} images".format(self.img_counter, self.img_count_all))
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.executor.shutdown()
+        parts = sorted(f for f in os.listdir(self.OUT_PATH) if f.startswith("results.") and f.endswith(".jsonl.part"))
+        if len(parts) > 0:
+            with open(os.path.join(self.OUT_PATH, "results.jsonl"), "ab") as results:
+                for part in parts:
+                    with open(os.path.join(self.OUT_PATH, part), "rb") as f:
+                        shutil.copyfileobj(f, results)
+                    os.remove(os.path.join(self.OUT_PATH, part))
@@ -0,0 +1,69 @@
+import cv2
+import numpy as np
+
+from detection.rectify import rectified_size
+
+# shape of a typical bib number: 2 to 5 digits printed a few percent of the frame height high
+BIB_ASPECT = (1.2, 4.0)
+BIB_HEIGHT = (0.01, 0.08)
+
+
+def _closeness(value: float, low: float, high: float) -> float:
+    # 1 inside [low, high], falling with the factor by which value is outside of it
+    if value <= 0:
+        return 0.0
+    return min(value / low, high / value, 1.0)
+
+
+def bib_likeness(poly, image_shape: tuple) -> float:
+    # between 0 and 1, how much the region looks like a bib number by its aspect ratio and its height
+    # relative to the image, used to read the most promising regions first
+    height, width = rectified_size(poly)
+    if height == 0:
+        return 0.0
+    return _closeness(width / height, *BIB_ASPECT) * _closeness(height / image_shape[0], *BIB_HEIGHT)
+
+
+def rank_regions(polys: list, scores: list[float], image_shape: tuple, indices: list[int] | None = None) -> list[int]:
+    # indices of the regions (all or only the given ones) by CRAFT text score times bib likeness, best first
+    indices = range(len(polys)) if indices is None else indices
+    return sorted(indices, key=lambda i: -scores[i] * bib_likeness(polys[i], image_shape))
+
+
+class RegionFilter:
+    # rejects CRAFT regions which can not be a bib number before they are sent to OCR:
+    # long text lines and banners (aspect ratio), tiny specks and huge logos (area relative to the image),
+    # regions outside of the part of the frame where the runners are (position of the center, relative)
+    # and regions with a low text score
+
+    def __init__(self, min_aspect: float = 0.3, max_aspect: float = 6.0, min_area: float = 0.00001,
+                 max_area: float = 0.05, min_x: float = 0.0, max_x: float = 1.0, min_y: float = 0.0,
+                 max_y: float = 1.0, min_score: float = 0.0):
+        self.min_aspect = min_aspect
+        self.max_aspect = max_aspect
+        self.min_area = min_area
+        self.max_area = max_area
+        self.min_x = min_x
+        self.max_x = max_x
+        self.min_y = min_y
+        self.max_y = max_y
+        self.min_score = min_score
+
+    def accept(self, poly, score: float, image_shape: tuple) -> bool:
+        height, width = rectified_size(poly)
+        if height == 0 or not self.min_aspect <= width / height <= self.max_aspect:
+            return False
+        poly = np.asarray(poly, dtype=np.float32).reshape(-1, 2)
+        image_area = image_shape[0] * image_shape[1]
+        if not self.min_area <= cv2.contourArea(poly) / image_area <= self.max_area:
+            return False
+        x, y = poly.mean(axis=0)
+        if not (self.min_x <= x / image_shape[1] <= self.max_x and self.min_y <= y / image_shape[0] <= self.max_y):
+            return False
+        return score >= self.min_score
+
+    def filter(self, polys: list, scores: list[float], image_shape: tuple) -> list[bool]:
+        return [self.accept(poly, score, image_shape) for poly, score in zip(polys, scores)]
+
+    def config(self) -> dict:
+        return dict(self.__dict__)
@@ -0,0 +1,62 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+
+class ResultCache:
+    def __init__(self, path: str, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                              "used REAL NOT NULL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+            self.size = self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    @staticmethod
+    def key(data: bytes | bytearray | memoryview | np.ndarray, config: str) -> str:
+        h = hashlib.sha256()
+        if isinstance(data, np.ndarray):
+            h.update(str(data.shape).encode())
+            data = np.ascontiguousarray(data)
+        h.update(data)
+        h.update(config.encode())
+        return h.hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # touching the entry keeps recently used results from being evicted
+            self.conn.execute("UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key: str, value: dict) -> None:
+        with self.lock, self.conn:
+            inserted = self.conn.execute("INSERT OR REPLACE INTO results (key, value, used) VALUES (?, ?, ?)",
+                                         (key, json.dumps(value), time.time())).rowcount
+            self.size += inserted
+            if self.size > self.max_entries:
+                # replaced entries are counted as inserts too, so recount before evicting
+                self.size = self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            if self.size > self.max_entries:
+                self.conn.execute("DELETE FROM results WHERE key IN "
+                                  "(SELECT key FROM results ORDER BY used ASC LIMIT ?)",
+                                  (self.size - self.max_entries,))
+                self.size = self.max_entries
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
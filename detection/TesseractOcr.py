@@ -0,0 +1,93 @@
+import logging
+import os
+import shlex
+import tempfile
+import threading
+
+import numpy as np
+import pytesseract
+from PIL import Image
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+PAGE_SEPARATOR = "\f"
+
+
+class TesseractOcr:
+    def __init__(self, config: str = "--psm 13"):
+        self.config = config
+        self.__psm, self.__variables = parse_config(config)
+        self.__local = threading.local()
+        self.__apis = []
+        self.__apis_lock = threading.Lock()
+
+    def image_to_string(self, img: np.ndarray) -> str:
+        return self.images_to_strings([img])[0]
+
+    def images_to_strings(self, imgs: list[np.ndarray]) -> list[str]:
+        # one entry per input image, empty crops are not sent to tesseract at all
+        results = [""] * len(imgs)
+        indices = [i for i, img in enumerate(imgs) if img is not None and img.size > 0]
+        if len(indices) == 0:
+            return results
+        pages = [imgs[i] for i in indices]
+        if tesserocr is not None:
+            texts = [self.__recognize_in_process(page) for page in pages]
+        else:
+            texts = self.__recognize_multipage(pages)
+        for i, text in zip(indices, texts):
+            results[i] = text.strip()
+        return results
+
+    def __recognize_in_process(self, img: np.ndarray) -> str:
+        # tesserocr keeps the engine loaded, one instance per thread since it is not thread safe
+        api = getattr(self.__local, "api", None)
+        if api is None:
+            api = tesserocr.PyTessBaseAPI(psm=self.__psm if self.__psm is not None else tesserocr.PSM.AUTO)
+            for key, value in self.__variables.items():
+                api.SetVariable(key, value)
+            self.__local.api = api
+            with self.__apis_lock:
+                self.__apis.append(api)
+        api.SetImage(Image.fromarray(img))
+        return api.GetUTF8Text()
+
+    def __recognize_multipage(self, pages: list[np.ndarray]) -> list[str]:
+        # all crops go into one multi page tiff so a single tesseract process recognizes them,
+        # the text of the pages is separated by form feeds
+        if len(pages) == 1:
+            return [pytesseract.image_to_string(pages[0], config=self.config)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "crops.tif")
+            imgs = [Image.fromarray(page) for page in pages]
+            imgs[0].save(path, save_all=True, append_images=imgs[1:])
+            texts = pytesseract.image_to_string(path, config=self.config).split(PAGE_SEPARATOR)
+        if len(texts) == len(pages) + 1 and texts[-1].strip() == "":
+            texts = texts[:-1]
+        if len(texts) != len(pages):
+            logging.warning("Could not split batched OCR result of {} crops, falling back to single crops"
+                            .format(len(pages)))
+            return [pytesseract.image_to_string(page, config=self.config) for page in pages]
+        return texts
+
+    def close(self):
+        with self.__apis_lock:
+            for api in self.__apis:
+                api.End()
+            self.__apis.clear()
+
+
+def parse_config(config: str) -> (int | None, dict[str, str]):
+    psm = None
+    variables = {}
+    args = shlex.split(config)
+    for i, arg in enumerate(args[:-1]):
+        if arg == "--psm":
+            psm = int(args[i + 1])
+        elif arg == "-c" and "=" in args[i + 1]:
+            key, value = args[i + 1].split("=", 1)
+            variables[key] = value
+    return psm, variables
@@ -0,0 +1,67 @@
+import numpy as np
+
+
+def candidate_rois(polys: list, image_shape: tuple, margin: float = 1.0) -> list[tuple[int, int, int, int]]:
+    # bounding boxes (x0, y0, x1, y1) of the coarse text regions, grown by margin times the region height
+    # on every side so the whole bib and the digits missed by the coarse pass are inside,
+    # overlapping boxes are merged so no part of the image is detected twice
+    height, width = image_shape[:2]
+    rois = []
+    for poly in polys:
+        poly = np.asarray(poly, dtype=np.float32).reshape(-1, 2)
+        x0, y0 = np.floor(poly.min(axis=0)).astype(int)
+        x1, y1 = np.ceil(poly.max(axis=0)).astype(int)
+        grow = int(np.ceil(margin * (y1 - y0)))
+        rois.append([max(x0 - grow, 0), max(y0 - grow, 0), min(x1 + grow, width), min(y1 + grow, height)])
+
+    merged = True
+    while merged:
+        merged = False
+        i = 0
+        while i < len(rois):
+            for j in range(len(rois) - 1, i, -1):
+                a, b = rois[i], rois[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    rois[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del rois[j]
+                    merged = True
+            i += 1
+    return [tuple(int(v) for v in r) for r in rois if r[2] > r[0] and r[3] > r[1]]
+
+
+class TwoStagePredictor:
+    # finds the text dense parts of the image with a cheap CRAFT pass at COARSE_LONG_SIZE and only runs
+    # those parts at the full resolution of LONG_SIZE, falls back to one full resolution pass if the
+    # candidates cover more than MAX_ROI_AREA of the image
+
+    def __init__(self, batcher, LONG_SIZE: int = 1280, COARSE_LONG_SIZE: int = 640, MARGIN: float = 1.0,
+                 MAX_ROI_AREA: float = 0.5):
+        self.batcher = batcher
+        self.LONG_SIZE = LONG_SIZE
+        self.COARSE_LONG_SIZE = COARSE_LONG_SIZE
+        self.MARGIN = MARGIN
+        self.MAX_ROI_AREA = MAX_ROI_AREA
+
+    def predict(self, image: np.ndarray) -> dict:
+        coarse = self.batcher.predict(image, self.COARSE_LONG_SIZE)
+        rois = candidate_rois(coarse["polys"], image.shape, self.MARGIN)
+        roi_area = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in rois)
+        if roi_area > self.MAX_ROI_AREA * image.shape[0] * image.shape[1]:
+            return dict(self.batcher.predict(image, self.LONG_SIZE), rois=None)
+
+        # every region is detected at the same scale the full frame would have been
+        scale = self.LONG_SIZE / max(image.shape[:2])
+        crops = [image[y0:y1, x0:x1] for x0, y0, x1, y1 in rois]
+        long_sizes = [max(32, int(round(max(crop.shape[:2]) * scale))) for crop in crops]
+        fine = self.batcher.predict_batch(crops, long_sizes) if len(crops) > 0 else []
+
+        ret = {"boxes": [], "polys": [], "scores": [], "heatmaps": coarse["heatmaps"],
+               "times": dict(coarse["times"]), "batch_size": coarse["batch_size"], "rois": rois}
+        for (x0, y0, _, _), prediction in zip(rois, fine):
+            offset = np.float32([x0, y0])
+            ret["boxes"] += [np.asarray(box) + offset for box in prediction["boxes"]]
+            ret["polys"] += [np.asarray(poly) + offset for poly in prediction["polys"]]
+            ret["scores"] += prediction["scores"]
+            for key, value in prediction["times"].items():
+                ret["times"][key] += value
+        return ret
@@ -0,0 +1,118 @@
+import logging
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+# the exported ONNX models are kept next to the weights craft_text_detector downloads
+MODEL_DIR = os.path.join(str(Path.home()), ".craft_text_detector", "weights")
+
+BACKENDS = ["torch", "onnx", "onnx-int8"]
+
+# one instance per backend and process, shared by all detectors
+_loaded: dict[tuple[str, bool], object] = {}
+_lock = threading.Lock()
+
+
+class TorchBackend:
+    # the full precision models of craft_text_detector
+    def __init__(self, cuda: bool = False):
+        from craft_text_detector import load_craftnet_model, load_refinenet_model
+        self.cuda = cuda
+        self.craft_net = load_craftnet_model(cuda)
+        self.refine_net = load_refinenet_model(cuda)
+
+    def forward(self, x: np.ndarray) -> (np.ndarray, np.ndarray):
+        # x is the normalized batch [b, c, h, w], returns the text and link score maps [b, h/2, w/2]
+        import torch
+        x = torch.from_numpy(x)
+        if self.cuda:
+            x = x.cuda()
+        with torch.no_grad():
+            y, feature = self.craft_net(x)
+            score_link = self.refine_net(y, feature)[:, :, :, 0]
+        return y[:, :, :, 0].cpu().data.numpy(), score_link.cpu().data.numpy()
+
+
+class OnnxBackend:
+    # CRAFT and the refiner exported into one ONNX graph, run by ONNX Runtime on the CPU. With int8 the weights
+    # of the graph are quantized to int8 (dynamic quantization of ONNX Runtime, which also covers the convolutions
+    # CRAFT consists of, torch.quantization.quantize_dynamic only quantizes Linear and LSTM layers)
+
+    def __init__(self, int8: bool = False):
+        import onnxruntime
+        path = export_onnx(os.path.join(MODEL_DIR, "craft_refiner.onnx"))
+        if int8:
+            path = quantize_onnx(path, os.path.join(MODEL_DIR, "craft_refiner_int8.onnx"))
+        options = onnxruntime.SessionOptions()
+        # the same number of threads torch would use, set per worker process in process mode
+        options.intra_op_num_threads = _torch_threads()
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input = self.session.get_inputs()[0].name
+
+    def forward(self, x: np.ndarray) -> (np.ndarray, np.ndarray):
+        score_text, score_link = self.session.run(None, {self.input: x})
+        return score_text, score_link
+
+
+def _torch_threads() -> int:
+    try:
+        import torch
+        return torch.get_num_threads()
+    except ImportError:
+        return os.cpu_count()
+
+
+def export_onnx(path: str) -> str:
+    # exports CRAFT with the refiner once, the file is reused by all later processes
+    if os.path.exists(path):
+        return path
+    import torch
+    from craft_text_detector import load_craftnet_model, load_refinenet_model
+
+    class CraftWithRefiner(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.craft_net = load_craftnet_model(False)
+            self.refine_net = load_refinenet_model(False)
+
+        def forward(self, x):
+            y, feature = self.craft_net(x)
+            return y[:, :, :, 0], self.refine_net(y, feature)[:, :, :, 0]
+
+    logging.info("Exporting CRAFT to {}".format(path))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    torch.onnx.export(CraftWithRefiner().eval(), torch.zeros(1, 3, 640, 640), tmp, opset_version=13,
+                      input_names=["image"], output_names=["score_text", "score_link"],
+                      dynamic_axes={"image": {0: "batch", 2: "height", 3: "width"},
+                                    "score_text": {0: "batch", 1: "height", 2: "width"},
+                                    "score_link": {0: "batch", 1: "height", 2: "width"}})
+    os.replace(tmp, path)
+    return path
+
+
+def quantize_onnx(path: str, out_path: str) -> str:
+    if os.path.exists(out_path):
+        return out_path
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    logging.info("Quantizing {} to {}".format(path, out_path))
+    tmp = out_path + ".tmp"
+    quantize_dynamic(path, tmp, weight_type=QuantType.QUInt8)
+    os.replace(tmp, out_path)
+    return out_path
+
+
+def get_backend(name: str = "torch", cuda: bool = False):
+    # loads the backend on first use, later calls of any thread return the same instance
+    if name not in BACKENDS:
+        raise ValueError("Unknown detection backend: {} (one of {})".format(name, ", ".join(BACKENDS)))
+    key = (name, cuda and name == "torch")
+    with _lock:
+        if key not in _loaded:
+            if name == "torch":
+                _loaded[key] = TorchBackend(cuda)
+            else:
+                _loaded[key] = OnnxBackend(int8=name == "onnx-int8")
+        return _loaded[key]
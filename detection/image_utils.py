@@ -0,0 +1,69 @@
+import fnmatch
+import os
+from typing import Iterable, Iterator
+
+import cv2
+import numpy as np
+
+ImageSource = str | bytes | bytearray | memoryview | np.ndarray
+
+
+def read_image_bytes(img_path: str) -> bytes:
+    with open(img_path, "rb") as f:
+        return f.read()
+
+
+def decode_image(data: bytes | bytearray | memoryview) -> np.ndarray:
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Could not decode image")
+    return image
+
+
+def load_image(image: ImageSource) -> np.ndarray:
+    # returns the image as BGR array, the same layout cv2.imread produces
+    if type(image) == str:
+        return decode_image(read_image_bytes(image))
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return decode_image(image)
+    if isinstance(image, np.ndarray):
+        if len(image.shape) == 2:
+            return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        if len(image.shape) == 3 and image.shape[2] == 4:
+            return cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+        return image
+    raise TypeError("Unsupported image type: {}".format(type(image)))
+
+
+def list_image_files(img_path: str | list) -> list[str]:
+    # flattens lists and directories (recursively) into the contained files
+    if type(img_path) == list:
+        return [f for p in img_path for f in list_image_files(p)]
+    if os.path.isdir(img_path):
+        return list_image_files([os.path.join(img_path, f) for f in sorted(os.listdir(img_path))])
+    return [img_path]
+
+
+def iter_image_files(img_paths: Iterable[str], recursive: bool = False,
+                     patterns: list[str] | None = None) -> Iterator[str]:
+    # lazy version of list_image_files for huge directories, files are yielded in directory order while
+    # the directory is read, patterns (fnmatch, e.g. "*.jpg") only filter the files found in directories
+    for img_path in img_paths:
+        if os.path.isdir(img_path):
+            yield from _scan(img_path, recursive, patterns)
+        else:
+            yield img_path
+
+
+def _scan(directory: str, recursive: bool, patterns: list[str] | None) -> Iterator[str]:
+    subdirectories = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                if recursive:
+                    subdirectories.append(entry.path)
+            elif patterns is None or any(fnmatch.fnmatch(entry.name, p) for p in patterns):
+                yield entry.path
+    # subdirectories are scanned after the directory is closed, so only one of them is open at a time
+    for subdirectory in subdirectories:
+        yield from _scan(subdirectory, recursive, patterns)
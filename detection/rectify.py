@@ -0,0 +1,66 @@
+import cv2
+import numpy as np
+
+
+def _edges(poly) -> (np.ndarray, np.ndarray, np.ndarray):
+    # CRAFT polygons list the top points left to right, then the bottom points right to left
+    poly = np.asarray(poly, dtype=np.float32).reshape(-1, 2)
+    n = int(len(poly) / 2) - 1
+    return poly, poly[:n + 1], poly[::-1][:n + 1]
+
+
+def _segment_widths(top: np.ndarray, bottom: np.ndarray) -> np.ndarray:
+    # same output size as the per segment affine rectification of craft_text_detector
+    return ((np.linalg.norm(top[1:] - top[:-1], axis=1) +
+             np.linalg.norm(bottom[1:] - bottom[:-1], axis=1)) / 2).astype(int)
+
+
+def rectified_size(poly) -> (int, int):
+    _, top, bottom = _edges(poly)
+    return int(np.linalg.norm(top[1:] - bottom[1:], axis=1).mean()), int(_segment_widths(top, bottom).sum())
+
+
+def rectify_poly(img: np.ndarray, poly, min_height: int = 0, min_width: int = 0) -> np.ndarray | None:
+    # straightens the region of a CRAFT polygon into a rectangle,
+    # returns None if the result would be smaller than min_height x min_width
+    poly, top, bottom = _edges(poly)
+    n = len(top) - 1
+    segment_widths = _segment_widths(top, bottom)
+    width = int(segment_widths.sum())
+    height = int(np.linalg.norm(top[1:] - bottom[1:], axis=1).mean())
+    if height < max(min_height, 1) or width < max(min_width, 1):
+        return None
+
+    # only the bounding box of the polygon (plus a margin for the interpolation) is warped
+    x0, y0 = np.maximum(np.floor(poly.min(axis=0)).astype(int) - 2, 0)
+    x1, y1 = np.ceil(poly.max(axis=0)).astype(int) + 3
+    roi = img[y0:y1, x0:x1]
+    if roi.size == 0:
+        return None
+    offset = np.float32([x0, y0])
+    top = top - offset
+    bottom = bottom - offset
+
+    if n == 1:
+        src = np.float32([top[0], top[1], bottom[1], bottom[0]])
+        dst = np.float32([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]])
+        return cv2.warpPerspective(roi, cv2.getPerspectiveTransform(src, dst), (width, height),
+                                   flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+    # curved polygons: every segment is interpolated bilinearly between its top and bottom edge,
+    # the source coordinates of all output pixels go into one grid for a single remap
+    map_x = np.empty((height, width), dtype=np.float32)
+    map_y = np.empty((height, width), dtype=np.float32)
+    v = (np.arange(height, dtype=np.float32) / max(height - 1, 1))[:, None, None]
+    width_step = 0
+    for k, w in enumerate(segment_widths):
+        if w == 0:
+            continue
+        u = (np.arange(w, dtype=np.float32) / max(w - 1, 1))[None, :, None]
+        upper = top[k] + u * (top[k + 1] - top[k])
+        lower = bottom[k] + u * (bottom[k + 1] - bottom[k])
+        src = upper + v * (lower - upper)
+        map_x[:, width_step:width_step + w] = src[:, :, 0]
+        map_y[:, width_step:width_step + w] = src[:, :, 1]
+        width_step += w
+    return cv2.remap(roi, map_x, map_y, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
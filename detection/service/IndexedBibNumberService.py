@@ -0,0 +1,95 @@
+import logging
+import os
+import re
+import time
+from typing import Iterable
+
+from detection.service.interface.IBibNumberService import IBibNumberService
+
+# digits tesseract commonly mistakes for each other on bibs
+CONFUSIONS = {"1": "7", "7": "1", "5": "6", "6": "5", "0": "8", "8": "0"}
+_AMBIGUOUS = -1
+
+
+class _Index:
+    def __init__(self, numbers: Iterable[int], fuzzy: bool, confusions: dict[str, str]):
+        self.numbers = sorted(set(n for n in numbers if n >= 0))
+        # one byte per possible number, a lookup is a single bounds check and index
+        self.bits = bytearray((self.numbers[-1] + 1) if len(self.numbers) > 0 else 0)
+        for n in self.numbers:
+            self.bits[n] = 1
+        # number read by OCR -> registered number it differs from in exactly one confusable digit,
+        # numbers which could be corrected to more than one registered number are not corrected at all
+        self.corrections: dict[int, int] = {}
+        if fuzzy:
+            for n in self.numbers:
+                digits = str(n)
+                for i, d in enumerate(digits):
+                    for c in confusions.get(d, ""):
+                        variant = int(digits[:i] + c + digits[i + 1:])
+                        if variant == n or self.contains(variant):
+                            continue
+                        self.corrections[variant] = n if variant not in self.corrections else _AMBIGUOUS
+
+    def contains(self, number: int) -> bool:
+        return 0 <= number < len(self.bits) and self.bits[number] == 1
+
+    def find(self, number: int) -> int | None:
+        if self.contains(number):
+            return number
+        corrected = self.corrections.get(number)
+        return None if corrected is None or corrected == _AMBIGUOUS else corrected
+
+
+class IndexedBibNumberService(IBibNumberService):
+    def __init__(self, numbers: Iterable[int] = (), fuzzy: bool = False, csv_file: str | None = None,
+                 reload_interval: float = 5.0, confusions: dict[str, str] = None):
+        self.fuzzy = fuzzy
+        self.confusions = confusions or CONFUSIONS
+        self.csv_file = csv_file
+        self.reload_interval = reload_interval
+        self.__mtime = None
+        self.__checked = 0.0
+        # replaced as a whole on reload, so readers never see a half built index
+        self.__index = _Index(numbers, fuzzy, self.confusions)
+        if csv_file is not None:
+            self.reload()
+
+    @staticmethod
+    def from_csv(csv_file: str, fuzzy: bool = False, reload_interval: float = 5.0) -> 'IndexedBibNumberService':
+        return IndexedBibNumberService(fuzzy=fuzzy, csv_file=csv_file, reload_interval=reload_interval)
+
+    def reload(self) -> bool:
+        # reads the registry again if the csv file changed, returns True if it was reloaded
+        self.__checked = time.time()
+        try:
+            mtime = os.path.getmtime(self.csv_file)
+            if mtime == self.__mtime:
+                return False
+            with open(self.csv_file, 'r', encoding="utf-8-sig") as f:
+                numbers = [int(m.group(1)) for m in (re.match(r"\s*(\d+)\s*(?:[;,\t]|$)", line) for line in f) if m]
+        except OSError as e:
+            logging.error("Could not load bib numbers from {}: {}".format(self.csv_file, e))
+            return False
+        self.__index = _Index(numbers, self.fuzzy, self.confusions)
+        self.__mtime = mtime
+        logging.info("Loaded {} bib numbers from {}".format(len(self.__index.numbers), self.csv_file))
+        return True
+
+    def __current(self) -> _Index:
+        if self.csv_file is not None and time.time() - self.__checked >= self.reload_interval:
+            self.reload()
+        return self.__index
+
+    def get_all_numbers(self) -> list[int]:
+        return self.__current().numbers
+
+    def find_number(self, number: int) -> int | None:
+        return self.__current().find(number)
+
+    def find_numbers(self, numbers: Iterable[int]) -> list[int]:
+        index = self.__current()
+        return [found for found in (index.find(n) for n in numbers) if found is not None]
+
+    def contains_number(self, number) -> bool:
+        return self.__current().contains(number)
@@ -1,15 +1,21 @@
+from typing import Iterable
+
 from detection.service.interface.IBibNumberService import IBibNumberService
 
 
 class MockBibNumberService(IBibNumberService):
     def __init__(self):
         self.numbers = list(range(1, 999))
+        self.__index = frozenset(self.numbers)
 
     def get_all_numbers(self) -> list[int]:
         return self.numbers
 
     def find_number(self, number: int) -> int | None:
-        return number if number in self.numbers else None
+        return number if number in self.__index else None
+
+    def find_numbers(self, numbers: Iterable[int]) -> list[int]:
+        return [n for n in numbers if n in self.__index]
 
     def contains_number(self, number) -> bool:
-        return number in self.numbers
\ No newline at end of file
+        return number in self.__index
@@ -1,4 +1,5 @@
 from abc import abstractmethod
+from typing import Iterable
 
 
 class IBibNumberService:
@@ -10,6 +11,10 @@ class IBibNumberService:
     def find_number(self, number: int) -> int | None:
         pass
 
+    @abstractmethod
+    def find_numbers(self, numbers: Iterable[int]) -> list[int]:
+        pass
+
     @abstractmethod
     def contains_number(self, number) -> bool:
         pass
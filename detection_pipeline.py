@@ -0,0 +1,75 @@
+import itertools
+import logging
+import os
+from queue import PriorityQueue, Queue
+from threading import Thread
+from typing import List
+
+from result_collector import ResultCollector
+
+
+class DetectionPipeline:
+    # files handed over by the watcher are queued by age (newest first) and detected by a pool of workers,
+    # the results are written to the ResultCollector by a single writer thread
+
+    def __init__(self, detector, results: ResultCollector, workers: int = 2, queue_size: int = 256):
+        self.detector = detector
+        self.results = results
+        self.queue: PriorityQueue = PriorityQueue(maxsize=queue_size)
+        self.done: Queue = Queue()
+        self.__sequence = itertools.count()
+
+        self.workers = [Thread(target=self.__work, name=f"detection-{i}") for i in range(workers)]
+        self.writer = Thread(target=self.__write, name="detection-writer")
+        for t in self.workers + [self.writer]:
+            t.start()
+
+    def submit(self, files: [str], mtimes: List[float] | None = None) -> None:
+        # mtimes are the modification times of the files if the caller already stat'ed them
+        self.results.detection_started(files)
+        for f, mtime in zip(files, mtimes or itertools.repeat(None)):
+            if mtime is None:
+                try:
+                    mtime = os.path.getmtime(f)
+                except OSError:
+                    mtime = 0
+            # blocks while the queue is full, which holds back the watcher until the workers caught up
+            self.queue.put((-mtime, next(self.__sequence), f))
+
+    def pending(self) -> int:
+        return self.queue.qsize()
+
+    def __work(self):
+        while True:
+            _, _, f = self.queue.get()
+            if f is None:
+                break
+            try:
+                record = self.detector.detect_image(f)
+            except Exception as e:
+                logging.error(e)
+                logging.error("Could not process image: {}".format(f))
+                record = None
+            # images that could not be detected still have to be reviewed manually
+            self.done.put((f, record["bibs"] if record else [], bool(record and record.get("partial"))))
+
+    def __write(self):
+        while True:
+            item = self.done.get()
+            if item is None:
+                break
+            f, bibs, partial = item
+            try:
+                self.results.add_ai({f: bibs}, [f] if partial else [])
+            except Exception as e:
+                logging.error(e)
+                logging.error("Could not store result of image: {}".format(f))
+
+    def stop(self) -> None:
+        # the sentinels sort after every queued file, so the queue is drained first
+        for _ in self.workers:
+            self.queue.put((float("inf"), next(self.__sequence), None))
+        for t in self.workers:
+            t.join()
+        self.done.put(None)
+        self.writer.join()
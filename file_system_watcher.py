@@ -1,36 +1,153 @@
-from threading import Thread
+import ctypes
+import ctypes.util
+import logging
 import os
-from time import sleep
+import select
+import stat
+import struct
+import sys
+from threading import Thread
+from time import sleep, time
+from typing import Callable, Dict, List, Tuple
 
-from result import ResultState
+import metrics
 from result_collector import ResultCollector
-from typing import Callable
+
+
+class Inotify:
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_Q_OVERFLOW = 0x00004000
+    __event = struct.Struct("iIII")
+
+    def __init__(self, directory: str):
+        self.__libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.__libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # only completely written or moved in files are reported, not every single write of an upload
+        if self.__libc.inotify_add_watch(self.fd, os.fsencode(directory), Inotify.IN_CLOSE_WRITE | Inotify.IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch failed")
+
+    def read(self, timeout: float) -> List[str] | None:
+        # returns the names of the changed files, or None if the kernel dropped events
+        if len(select.select([self.fd], [], [], timeout)[0]) == 0:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names = []
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = Inotify.__event.unpack_from(data, offset)
+            offset += Inotify.__event.size
+            if mask & Inotify.IN_Q_OVERFLOW:
+                return None
+            names.append(os.fsdecode(data[offset:offset + length].rstrip(b"\0")))
+            offset += length
+        return names
+
+    def close(self):
+        os.close(self.fd)
 
 
 class FileSystemWatcher:
 
-    def __init__(self, image_directory: str, result_collector: ResultCollector):
+    def __init__(self, image_directory: str, result_collector: ResultCollector, debounce: float = 0.5,
+                 poll_interval: float = 1, use_inotify: bool | None = None):
         self.image_directory =os.path.normpath(image_directory)
-        self.listeners: [Callable[[[str]], None]] = []
+        self.listeners: [Callable[[[str], [float]], None]] = []
         self.result_collector = result_collector
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = sys.platform.startswith("linux") if use_inotify is None else use_inotify
+
+        # path -> (mtime, size) of every file seen, and path -> time of the last change for files not emitted yet
+        self.__known: Dict[str, Tuple[float, int]] = {}
+        self.__pending: Dict[str, float] = {}
 
         self.watching = True
         self.watcher = Thread(target=self.watch)
         self.watcher.start()
 
-    def add_listener(self, listener: Callable[[[str]], None]):
+    def add_listener(self, listener: Callable[[[str], [float]], None]):
+        # listener(files, mtimes) gets the new files with the modification times the watcher already stat'ed
         self.listeners.append(listener)
 
     def watch(self):
-        while self.watching:
-            files = [os.path.join(self.image_directory,f) for f in os.listdir(self.image_directory)]
-            done = [r.get_image() for r in self.result_collector.results.values() if r.get_state() != ResultState.FTP_UPLOADED]
-            files = [f for f in files if f not in done]
-            if len(files) > 0:
-                self.result_collector.add_images(files)
-                for li in self.listeners:
-                    li(files)
-            sleep(1)
+        events = None
+        if self.use_inotify:
+            try:
+                events = Inotify(self.image_directory)
+            except OSError as e:
+                logging.warning("inotify not available, falling back to polling: {}".format(e))
+        try:
+            # files which already exist are picked up once, afterwards only changes are looked at
+            self.__scan()
+            while self.watching:
+                if events is None:
+                    sleep(self.poll_interval)
+                    self.__scan()
+                else:
+                    names = events.read(self.debounce if len(self.__pending) > 0 else 1)
+                    if names is None:
+                        self.__scan()
+                    else:
+                        now = time()
+                        for name in names:
+                            path = os.path.join(self.image_directory, name)
+                            self.__pending[path] = now
+                            # the file changed after it was listed, it is stat'ed again before it is emitted
+                            self.__known.pop(path, None)
+                self.__emit()
+        finally:
+            if events is not None:
+                events.close()
+
+    def __scan(self):
+        now = time()
+        with os.scandir(self.image_directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+                signature = (st.st_mtime, st.st_size)
+                path = os.path.join(self.image_directory, entry.name)
+                # a file still being written changes its signature and restarts its debounce window
+                if self.__known.get(path) != signature:
+                    self.__known[path] = signature
+                    self.__pending[path] = now
+
+    def __emit(self):
+        now = time()
+        stable = [f for f, changed in self.__pending.items() if now - changed >= self.debounce]
+        for f in stable:
+            del self.__pending[f]
+        files = []
+        mtimes = []
+        for f in stable:
+            if not self.result_collector.needs_detection(f):
+                continue
+            # the stat data of the directory listing is reused, only files reported by inotify are stat'ed
+            signature = self.__known.get(f)
+            if signature is None:
+                try:
+                    st = os.stat(f)
+                except OSError:
+                    continue
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+                signature = (st.st_mtime, st.st_size)
+            files.append(f)
+            mtimes.append(signature[0])
+        if len(files) > 0:
+            self.result_collector.add_images(files, mtimes)
+            metrics.WATCHER_FILES.inc(len(files))
+            for li in self.listeners:
+                li(files, mtimes)
 
     def stop(self):
         self.watching = False
@@ -0,0 +1,196 @@
+import itertools
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Set, Tuple
+
+
+class JobTable:
+    # durable queue of the images to detect in a SQLite file, shared by several detector processes and, through a
+    # shared directory, by several hosts. A worker claims images with a lease of lease seconds and extends it with
+    # heartbeats while it detects them, images whose lease ran out (crashed or disconnected worker) are handed out
+    # again, after max_attempts claims they are given up and go to the manual review without bib numbers.
+    # Every finished image gets the next sequence number, so readers only fetch what finished since their last call.
+    QUEUED = "queued"
+    LEASED = "leased"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, path: str, lease: float = 60.0, max_attempts: int = 3):
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        # transactions are started explicitly, so claims hold the write lock from reading the queue to leasing
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        with self.lock:
+            # WAL needs memory shared between the processes and does not work on network shares
+            self.conn.execute("PRAGMA journal_mode=DELETE")
+            self.conn.execute("PRAGMA synchronous=FULL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS jobs (image TEXT PRIMARY KEY, mtime REAL NOT NULL, "
+                              "state TEXT NOT NULL, worker TEXT, lease_until REAL, attempts INTEGER NOT NULL, "
+                              "bibs TEXT, partial INTEGER NOT NULL DEFAULT 0, seq INTEGER)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (state, mtime)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_seq ON jobs (seq)")
+
+    @contextmanager
+    def __transaction(self):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def add(self, images: List[str], mtimes: List[float] | None = None) -> int:
+        # queues the images not known yet, returns how many were added, mtimes are the modification times of the
+        # images if the caller already stat'ed them
+        rows = []
+        for image, mtime in zip(images, mtimes or itertools.repeat(None)):
+            if mtime is None:
+                try:
+                    mtime = os.path.getmtime(image)
+                except OSError:
+                    mtime = 0
+            rows.append((image, mtime, JobTable.QUEUED))
+        with self.__transaction() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO jobs (image, mtime, state, attempts) VALUES (?, ?, ?, 0)", rows)
+            return conn.total_changes - before
+
+    def claim(self, worker: str, limit: int = 1) -> List[str]:
+        # leases up to limit queued images to worker, the newest first like the local detection pipeline
+        now = time.time()
+        with self.__transaction() as conn:
+            self.__expire(now)
+            images = [row[0] for row in conn.execute(
+                "SELECT image FROM jobs WHERE state = ? ORDER BY mtime DESC LIMIT ?", (JobTable.QUEUED, limit))]
+            conn.executemany("UPDATE jobs SET state = ?, worker = ?, lease_until = ?, attempts = attempts + 1 "
+                             "WHERE image = ?", [(JobTable.LEASED, worker, now + self.lease, i) for i in images])
+        return images
+
+    def __expire(self, now: float) -> None:
+        # leases which ran out go back to the queue, or are given up after max_attempts claims
+        failed = [row[0] for row in self.conn.execute(
+            "SELECT image FROM jobs WHERE state = ? AND lease_until < ? AND attempts >= ?",
+            (JobTable.LEASED, now, self.max_attempts))]
+        self.conn.executemany("UPDATE jobs SET state = ?, bibs = '[]', worker = NULL, lease_until = NULL, "
+                              "seq = (SELECT COALESCE(MAX(seq), 0) FROM jobs) + 1 WHERE image = ?",
+                              [(JobTable.FAILED, image) for image in failed])
+        self.conn.execute("UPDATE jobs SET state = ?, worker = NULL, lease_until = NULL "
+                          "WHERE state = ? AND lease_until < ?", (JobTable.QUEUED, JobTable.LEASED, now))
+
+    def heartbeat(self, worker: str, images: List[str]) -> List[str]:
+        # extends the leases of the images, returns the ones worker still holds
+        if len(images) == 0:
+            return []
+        lease_until = time.time() + self.lease
+        with self.__transaction() as conn:
+            return [image for image in images if conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE image = ? AND worker = ? AND state = ?",
+                (lease_until, image, worker, JobTable.LEASED)).rowcount == 1]
+
+    def complete(self, worker: str, image: str, bibs: List[int], partial: bool = False) -> bool:
+        # stores the result, False if the lease was lost in the meantime and the image belongs to someone else
+        with self.__transaction() as conn:
+            return conn.execute("UPDATE jobs SET state = ?, bibs = ?, partial = ?, lease_until = NULL, "
+                                "seq = (SELECT COALESCE(MAX(seq), 0) FROM jobs) + 1 "
+                                "WHERE image = ? AND worker = ? AND state = ?",
+                                (JobTable.DONE, json.dumps(bibs), int(partial), image, worker,
+                                 JobTable.LEASED)).rowcount == 1
+
+    def release(self, worker: str, images: List[str] | None = None) -> None:
+        # hands the images (all of worker if None) back to the queue without counting the attempt,
+        # e.g. when a worker shuts down
+        query = "UPDATE jobs SET state = ?, worker = NULL, lease_until = NULL, attempts = attempts - 1 " \
+                "WHERE worker = ? AND state = ?"
+        with self.__transaction() as conn:
+            if images is None:
+                conn.execute(query, (JobTable.QUEUED, worker, JobTable.LEASED))
+            else:
+                conn.executemany(query + " AND image = ?",
+                                 [(JobTable.QUEUED, worker, JobTable.LEASED, image) for image in images])
+
+    def finished(self, after: int = 0) -> List[Tuple[int, str, List[int], bool]]:
+        # (seq, image, bibs, partial) of the images finished after seq, failed images have no bib numbers
+        with self.lock:
+            rows = self.conn.execute("SELECT seq, image, bibs, partial FROM jobs WHERE seq > ? ORDER BY seq",
+                                     (after,)).fetchall()
+        return [(seq, image, json.loads(bibs), bool(partial)) for seq, image, bibs, partial in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+
+class JobWorker:
+    # detects the images of a JobTable on threads threads, every thread claims one image at a time, the leases of
+    # the images in progress are kept alive by a heartbeat every third of the lease time
+    def __init__(self, detector, jobs: JobTable, threads: int = 1, name: str | None = None,
+                 poll_interval: float = 1.0):
+        self.detector = detector
+        self.jobs = jobs
+        self.name = name or "{}-{}".format(socket.gethostname(), os.getpid())
+        self.poll_interval = poll_interval
+        self.processed = 0
+        self.lock = threading.Lock()
+        self.in_progress: Set[str] = set()
+        self.stopped = threading.Event()
+        self.workers = [threading.Thread(target=self.__work, name=f"job-worker-{i}") for i in range(threads)]
+        self.heartbeat = threading.Thread(target=self.__heartbeat, name="job-heartbeat", daemon=True)
+        for t in self.workers + [self.heartbeat]:
+            t.start()
+
+    def __work(self):
+        while not self.stopped.is_set():
+            images = self.jobs.claim(self.name)
+            if len(images) == 0:
+                self.stopped.wait(self.poll_interval)
+                continue
+            image = images[0]
+            with self.lock:
+                self.in_progress.add(image)
+            try:
+                record = self.detector.detect_image(image)
+            except Exception as e:
+                logging.error(e)
+                logging.error("Could not process image: {}".format(image))
+                record = None
+            finally:
+                with self.lock:
+                    self.in_progress.discard(image)
+            # images that could not be detected still have to be reviewed manually
+            if not self.jobs.complete(self.name, image, record["bibs"] if record else [],
+                                      bool(record and record.get("partial"))):
+                logging.warning("Lease of {} was lost, its result is dropped".format(image))
+            with self.lock:
+                self.processed += 1
+
+    def __heartbeat(self):
+        while not self.stopped.wait(self.jobs.lease / 3):
+            with self.lock:
+                images = list(self.in_progress)
+            try:
+                lost = set(images) - set(self.jobs.heartbeat(self.name, images))
+            except sqlite3.Error as e:
+                logging.error("Heartbeat failed: {}".format(e))
+                continue
+            for image in lost:
+                logging.warning("Lease of {} was lost".format(image))
+
+    def stop(self) -> None:
+        # the images in progress are finished, nothing is left leased to this worker
+        self.stopped.set()
+        for t in self.workers + [self.heartbeat]:
+            t.join()
+        self.jobs.release(self.name)
@@ -0,0 +1,221 @@
+import bisect
+import cProfile
+import os
+import threading
+import time
+from typing import Callable, Dict, Tuple
+
+# instruments only record while enabled, a disabled instrument costs one attribute lookup per call
+_enabled = False
+_started = time.time()
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def enable(enabled: bool = True) -> None:
+    global _enabled, _started
+    _enabled = enabled
+    _started = time.time()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if len(names) == 0:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(n, str(v).replace('"', '\\"')) for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.lock = threading.Lock()
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        if not _enabled:
+            return
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> [str]:
+        with self.lock:
+            return ["{}{} {}".format(self.name, _labels(self.labelnames, k), v) for k, v in self.values.items()]
+
+    def summary(self):
+        with self.lock:
+            if len(self.labelnames) == 0:
+                return self.values.get((), 0)
+            return {",".join(k): v for k, v in self.values.items()}
+
+
+class Gauge:
+    # the value is read from fn when the metrics are collected, fn returns {label values: value}
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 fn: Callable[[], Dict[Tuple[str, ...], float]] | None = None):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.fn = fn
+
+    def collect(self) -> Dict[Tuple[str, ...], float]:
+        return self.fn() if self.fn is not None else {}
+
+    def render(self) -> [str]:
+        return ["{}{} {}".format(self.name, _labels(self.labelnames, k), v) for k, v in self.collect().items()]
+
+    def summary(self):
+        values = self.collect()
+        if len(self.labelnames) == 0:
+            return values.get((), 0)
+        return {",".join(k): v for k, v in values.items()}
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        # label values -> [count per bucket (the last one is +Inf), sum]
+        self.values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        if not _enabled:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            v = self.values.get(labels)
+            if v is None:
+                v = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            v[0][i] += 1
+            v[1] += value
+
+    def render(self) -> [str]:
+        lines = []
+        with self.lock:
+            for k, (counts, total) in self.values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append("{}_bucket{} {}".format(self.name, _labels(self.labelnames + ("le",), k + (le,)),
+                                                         cumulative))
+                lines.append("{}_sum{} {}".format(self.name, _labels(self.labelnames, k), total))
+                lines.append("{}_count{} {}".format(self.name, _labels(self.labelnames, k), cumulative))
+        return lines
+
+    def summary(self):
+        with self.lock:
+            ret = {}
+            for k, (counts, total) in self.values.items():
+                count = sum(counts)
+                ret[",".join(k)] = {"count": count, "sum": total, "mean": total / count if count > 0 else 0}
+            return ret if len(self.labelnames) > 0 else ret.get("", {"count": 0, "sum": 0, "mean": 0})
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Counter | Gauge | Histogram] = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def drain(self) -> dict:
+        # takes the recorded values of all counters and histograms, used to move them out of worker processes
+        ret = {}
+        for name, metric in self.metrics.items():
+            if isinstance(metric, (Counter, Histogram)):
+                with metric.lock:
+                    ret[name], metric.values = metric.values, {}
+        return ret
+
+    def merge(self, drained: dict) -> None:
+        for name, values in drained.items():
+            metric = self.metrics[name]
+            with metric.lock:
+                for k, v in values.items():
+                    if isinstance(metric, Counter):
+                        metric.values[k] = metric.values.get(k, 0) + v
+                    elif k not in metric.values:
+                        metric.values[k] = v
+                    else:
+                        own = metric.values[k]
+                        own[0] = [a + b for a, b in zip(own[0], v[0])]
+                        own[1] += v[1]
+
+    def render(self) -> str:
+        # prometheus text exposition format
+        lines = []
+        for metric in self.metrics.values():
+            kind = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}[type(metric)]
+            lines.append("# HELP {} {}".format(metric.name, metric.help))
+            lines.append("# TYPE {} {}".format(metric.name, kind))
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict:
+        ret = {name: metric.summary() for name, metric in self.metrics.items()}
+        uptime = time.time() - _started
+        ret["uptime_seconds"] = uptime
+        ret["images_per_second"] = IMAGES.summary() / uptime if uptime > 0 else 0
+        hits = CACHE_REQUESTS.summary().get("hit", 0)
+        requests = hits + CACHE_REQUESTS.summary().get("miss", 0)
+        ret["cache_hit_rate"] = hits / requests if requests > 0 else None
+        return ret
+
+
+REGISTRY = Registry()
+
+IMAGES = REGISTRY.register(Counter("bib_images_total", "Images processed by the detector"))
+PARTIAL_IMAGES = REGISTRY.register(Counter("bib_images_partial_total",
+                                           "Images whose regions were not all read within the time budget"))
+STAGE_SECONDS = REGISTRY.register(Histogram("bib_stage_seconds", "Seconds per image spent in a detection stage",
+                                            ("stage",)))
+OCR_BOXES = REGISTRY.register(Histogram("bib_ocr_boxes_per_image", "Text regions sent to OCR per image", (),
+                                        (0, 1, 2, 5, 10, 20, 50, 100)))
+OCR_CALLS = REGISTRY.register(Histogram("bib_ocr_calls_per_image", "OCR calls per image, each reads a chunk of regions",
+                                        (), (0, 1, 2, 5, 10, 20)))
+OCR_BOX_SECONDS = REGISTRY.register(Histogram("bib_ocr_box_seconds", "Seconds of OCR per text region"))
+CACHE_REQUESTS = REGISTRY.register(Counter("bib_cache_requests_total", "Result cache lookups", ("result",)))
+WATCHER_FILES = REGISTRY.register(Counter("bib_watcher_files_total", "New images found by the file system watcher"))
+API_UPLOAD_SECONDS = REGISTRY.register(Histogram("bib_api_upload_seconds", "Seconds per upload to the timing API"))
+API_UPLOAD_FAILURES = REGISTRY.register(Counter("bib_api_upload_failures_total", "Failed uploads to the timing API"))
+RESULTS = REGISTRY.register(Gauge("bib_results", "Results per state", ("state",)))
+
+
+# cProfile can only be active once per process (python 3.12 raises ValueError otherwise)
+_profile_lock = threading.Lock()
+_profile_count = 0
+
+
+class Profiler:
+    # dumps one cProfile file per image into directory, readable with pstats or snakeviz. Only one image is
+    # profiled at a time, images of other threads run unprofiled meanwhile, with --threads 1 every image is profiled
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def run(self, name: str, fn: Callable, *args):
+        global _profile_count
+        if not _profile_lock.acquire(blocking=False):
+            return fn(*args)
+        try:
+            # images of the same name from different directories or worker processes get files of their own
+            _profile_count += 1
+            path = os.path.join(self.directory, "{}.{}.{}.prof".format(os.path.basename(name), os.getpid(),
+                                                                       _profile_count))
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(fn, *args)
+            finally:
+                profile.dump_stats(path)
+        finally:
+            _profile_lock.release()
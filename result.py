@@ -1,7 +1,8 @@
 import os
-from datetime import datetime
+import sys
+import time
 from enum import Flag, IntEnum
-from typing import Dict, Set
+from typing import Callable, Set
 
 
 class InvalidStateException(Exception):
@@ -23,32 +24,50 @@ class ResultType(IntEnum):
     FINISH = 2  # "finish"
 
 
+# shared by all results without numbers, add_numbers replaces it with a set of their own
+_NO_NUMBERS: Set[int] = frozenset()
+
+
 class Result:
+    # one per image of a race weekend, so slotted: no __dict__, the path interned (it is also the key of the
+    # collector's dictionaries), the time as the float mtime and no set as long as there are no numbers
+    __slots__ = ("__image", "__time", "__state", "__type", "__numbers", "__listener")
     header = "tag_id;timestamp;is_car"
 
-    def __init__(self, img: str | Dict, result_type: ResultType | None = None, state=ResultState.FTP_UPLOADED,
-                 numbers: Set[int] = None):
-        self.__numbers = numbers or set()
-        if type(img) == str:
-            self.__image = img
-            self.__time = datetime.utcfromtimestamp(os.path.getmtime(img))
-            self.__state = state
-            self.__type = result_type
-        else:
-            self.__dict__ = img
+    def __init__(self, img: str, result_type: ResultType | None = None, state=ResultState.FTP_UPLOADED,
+                 numbers: Set[int] = None, mtime: float | None = None):
+        # mtime is the stat time the caller already has (e.g. from os.scandir), without it the file is only
+        # stat'ed when the time is needed for the upload
+        self.__image = sys.intern(img)
+        self.__time = mtime
+        self.__state = state
+        self.__type = result_type
+        self.__numbers = numbers or _NO_NUMBERS
+        self.__listener = None
+
+    def set_listener(self, listener: Callable[['Result', ResultState], None] | None) -> None:
+        # the listener is called with the result and its previous state after every state change
+        self.__listener = listener
+
+    def __set_state(self, state: ResultState) -> None:
+        old = self.__state
+        self.__state = state
+        if self.__listener is not None:
+            self.__listener(self, old)
 
     def add_numbers(self, numbers: [int]) -> None:
         if self.__state & ResultState.DETECTING:
-            for n in numbers:
-                self.__numbers.add(n)
-            self.__state = ResultState((self.__state.value - 1) << 1)
+            if len(numbers) > 0:
+                self.__numbers = set(self.__numbers)
+                self.__numbers.update(numbers)
+            self.__set_state(ResultState((self.__state.value - 1) << 1))
         else:
             raise InvalidStateException
 
     def next_state(self):
         v = self.__state.value << 1
         if v == 16 or v == 4: v += 1
-        self.__state = ResultState(v)
+        self.__set_state(ResultState(v))
         return self
 
     def get_state(self) -> ResultState:
@@ -57,20 +76,35 @@ class Result:
     def get_image(self) -> str:
         return self.__image
 
+    def get_time(self) -> float:
+        if self.__time is None:
+            self.__time = os.path.getmtime(self.__image)
+        return self.__time
+
     def get_csv(self) -> [str]:
-        return [f'{number};{self.__time.strftime("%Y-%m-%d %H:%M:%S")};{self.__type.name.lower()}' for number in
-                self.__numbers]
+        # rounded to microseconds first like datetime.utcfromtimestamp, which was used before
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(round(self.get_time(), 6)))
+        return [f'{number};{timestamp};{self.__type.name.lower()}' for number in self.__numbers]
 
     def get_one_line_csv(self) -> str:
-        return f'{self.__image};{self.__type};{self.__state.name};{";".join([str(v) for v in self.__numbers])}\n'
+        # the mtime is written if it is known, so a restored result is uploaded without reading the file again
+        mtime = "" if self.__time is None else repr(self.__time)
+        numbers = ";".join([str(v) for v in self.__numbers])
+        return f'{self.__image};{self.__type};{self.__state.name};{mtime};{numbers}\n'
 
     @staticmethod
     def parse_one_line_csv(line) -> [str]:
         p = line.strip().split(";")
-        return Result(p[0], ResultType(int(p[1])), ResultState[p[2]], {int(v) for v in p[3:] if len(v) > 0})
+        mtime = None
+        # lines of older versions have no mtime, their fourth field is a bib number (no ".") or missing
+        if len(p) > 3 and (p[3] == "" or "." in p[3]):
+            mtime = float(p[3]) if p[3] != "" else None
+            p = p[:3] + p[4:]
+        return Result(p[0], ResultType(int(p[1])), ResultState[p[2]], {int(v) for v in p[3:] if len(v) > 0},
+                      mtime=mtime)
 
     def detection_started(self):
         if self.__state == ResultState.FTP_UPLOADED:
-            self.__state = ResultState.DETECTING_AI
+            self.__set_state(ResultState.DETECTING_AI)
         else:
             raise InvalidStateException
@@ -1,74 +1,200 @@
+import itertools
+import logging
 import os
-from typing import Dict, List, Tuple
+from collections import defaultdict
+from threading import Event, RLock, Thread
+from typing import Dict, Iterable, List, Set, Tuple
 
+import metrics
 from client import ApiClient
+from job_table import JobTable
 from result import Result, ResultType, ResultState
+from result_journal import ResultJournal
+from uploader import Uploader
 
 
 class ResultCollector:
     results: Dict[str, Result]
 
     def __init__(self, client: ApiClient, result_type: ResultType, buffer_file: str, image_dir: str,
-                 batch_size: int = 1):
+                 batch_size: int = 1, upload_window: float = 1.0, jobs: JobTable | None = None,
+                 sync_interval: float = 1.0):
         self.client = client
         self.buffer_file = buffer_file
         self.batchSize = batch_size
         self.result_type = result_type
         self.image_dir = image_dir
-
-        if os.path.exists(buffer_file):
-            with open(buffer_file, 'r') as f:
-                c = f.readlines()
-                res = [Result.parse_one_line_csv(r) for r in c]
-                if len(res) > 0:
-                    self.results = {r.get_image(): r for r in res}
-                    self.__send()
-                    return
+        self.journal = ResultJournal(buffer_file)
+        # the watcher, the detection writer and the HTTP handlers all use the collector
+        self.lock = RLock()
         self.results = {}
+        # results by state in the order they reached it, kept up to date by the state listener of every result
+        self.by_state: Dict[ResultState, Dict[str, Result]] = defaultdict(dict)
+        # images the detection could not read completely within its time budget, flagged for the reviewers
+        self.partial: Set[str] = set()
+        # results the uploader could not build lines for, taken out of the upload queue until the next start
+        self.upload_failed: Dict[str, Result] = {}
+        metrics.RESULTS.fn = self.__state_counts
+
+        # only the latest line of every image is parsed
+        latest = {}
+        for line in self.journal.load():
+            latest[line.split(";", 1)[0]] = line
+        if len(latest) > 0:
+            for r in latest.values():
+                self.__track(Result.parse_one_line_csv(r))
+
+        # results are uploaded in the background, in batches of up to batch_size results
+        self.uploader = Uploader(client, self.get_upload_pending, self.__uploaded,
+                                 lambda: self.count(ResultState.PENDING_UPLOAD), batch_size, upload_window,
+                                 buffer_file + ".sent", failed=self.__upload_failed)
+        self.uploader.notify()
+
+        # with a job table the images are detected by the workers of all hosts, their results are read back from it
+        self.jobs = jobs
+        self.__jobs_seq = 0
+        self.closing = Event()
+        self.sync_thread = None
+        if jobs is not None:
+            self.sync_thread = Thread(target=self.__sync, args=(sync_interval,), name="job-sync", daemon=True)
+            self.sync_thread.start()
 
     def add_manually(self, numbers: [int], image_file: str) -> None:
-
-        img = os.path.normpath(os.path.join(self.image_dir, image_file))
-        self.results[img].add_numbers(numbers)
-
-        self.__send()
-
-    def add_ai(self, res: Dict[str, List[int]]) -> None:
-        for r in res:
-            self.results[r].add_numbers(res[r])
-        self.__buffer()
+        with self.lock:
+            img = os.path.normpath(os.path.join(self.image_dir, image_file))
+            self.results[img].add_numbers(numbers)
+            self.partial.discard(img)
+            # a manual entry must be on disk before the request is acknowledged
+            self.__buffer([self.results[img]], sync=True)
+        self.uploader.notify()
+
+    def add_ai(self, res: Dict[str, List[int]], partial: Iterable[str] = ()) -> None:
+        with self.lock:
+            for r in res:
+                self.results[r].add_numbers(res[r])
+            self.partial.update(partial)
+            self.__buffer([self.results[r] for r in res])
 
     def get_manual_pending(self) -> Tuple[str, List[int]] | None:
-        p = [r for r in self.results.values() if r.get_state() == ResultState.PENDING_MANUALLY]
-        if len(p) == 0:
-            return None
-        return p[0].next_state().get_image()
+        with self.lock:
+            p = self.by_state[ResultState.PENDING_MANUALLY]
+            if len(p) == 0:
+                return None
+            return next(iter(p.values())).next_state().get_image()
+
+    def peek_manual_pending(self, limit: int) -> [str]:
+        # the next images get_manual_pending will hand out, without taking them
+        with self.lock:
+            return [r.get_image() for r in
+                    itertools.islice(self.by_state[ResultState.PENDING_MANUALLY].values(), limit)]
+
+    def is_partial(self, img: str) -> bool:
+        with self.lock:
+            return img in self.partial
 
     def get_ai_pending(self) -> [Result]:
-        return [r.next_state() for r in self.results.values() if r.get_state() == ResultState.FTP_UPLOADED]
+        with self.lock:
+            return [r.next_state() for r in list(self.by_state[ResultState.FTP_UPLOADED].values())]
 
-    def __buffer(self) -> None:
-        with open(self.buffer_file, 'w') as f:
-            c = [v.get_one_line_csv() for v in self.results.values()]
-            f.writelines(c)
+    def get_upload_pending(self, limit: int) -> [Result]:
+        with self.lock:
+            return list(itertools.islice(self.by_state[ResultState.PENDING_UPLOAD].values(), limit))
 
-    def add_images(self, files: [str]) -> None:
-        for f in files:
-            self.results[f] = Result(f, self.result_type)
-        self.__buffer()
-
-    def detection_started(self, files):
-        for f in files:
-            self.results[f].detection_started()
-
-    def __send(self):
-        pending = [r for r in self.results.values() if r.get_state() == ResultState.PENDING_UPLOAD]
-        lines = [l for r in pending for l in r.get_csv()]
-        try:
-            if self.client.send(lines):
-                for r in pending:
+    def __uploaded(self, results: [Result]) -> None:
+        with self.lock:
+            for r in results:
+                if r.get_state() == ResultState.PENDING_UPLOAD:
                     r.next_state()
-        except:
-            pass
+            self.__buffer(results)
+
+    def __upload_failed(self, results: [Result]) -> None:
+        with self.lock:
+            for r in results:
+                self.by_state[ResultState.PENDING_UPLOAD].pop(r.get_image(), None)
+                self.upload_failed[r.get_image()] = r
+
+    def queue_detection(self, files: [str], mtimes: List[float] | None = None) -> None:
+        # hands the images to the job table instead of a local detection pipeline
+        self.detection_started(files)
+        self.jobs.add(files, mtimes)
+
+    def sync_jobs(self) -> int:
+        # takes over the results the workers wrote to the job table since the last call, replaying a result
+        # (e.g. after a restart) does not change an image that already left the detection
+        finished = self.jobs.finished(self.__jobs_seq)
+        if len(finished) == 0:
+            return 0
+        with self.lock:
+            res = {}
+            partial = []
+            for _, image, bibs, is_partial in finished:
+                r = self.results.get(image)
+                if r is None or r.get_state() not in [ResultState.FTP_UPLOADED, ResultState.DETECTING_AI]:
+                    continue
+                if r.get_state() == ResultState.FTP_UPLOADED:
+                    r.detection_started()
+                res[image] = bibs
+                if is_partial:
+                    partial.append(image)
+            self.add_ai(res, partial)
+        self.__jobs_seq = finished[-1][0]
+        return len(res)
+
+    def __sync(self, interval: float):
+        while not self.closing.wait(interval):
+            try:
+                self.sync_jobs()
+            except Exception as e:
+                logging.error("Could not read the job table: {}".format(e))
+
+    def needs_detection(self, img: str) -> bool:
+        with self.lock:
+            # unknown images and images whose detection never started (e.g. before a restart)
+            r = self.results.get(img)
+            return r is None or r.get_state() == ResultState.FTP_UPLOADED
+
+    def count(self, state: ResultState) -> int:
+        with self.lock:
+            return len(self.by_state[state])
+
+    def __state_counts(self) -> Dict[Tuple[str, ...], int]:
+        with self.lock:
+            return {(state.name,): len(results) for state, results in list(self.by_state.items())}
+
+    def __track(self, result: Result) -> None:
+        old = self.results.get(result.get_image())
+        if old is not None:
+            old.set_listener(None)
+            self.by_state[old.get_state()].pop(old.get_image(), None)
+        self.results[result.get_image()] = result
+        self.by_state[result.get_state()][result.get_image()] = result
+        result.set_listener(self.__state_changed)
+
+    def __state_changed(self, result: Result, old: ResultState) -> None:
+        self.by_state[old].pop(result.get_image(), None)
+        self.by_state[result.get_state()][result.get_image()] = result
+
+    def __buffer(self, changed: [Result], sync: bool = False) -> None:
+        self.journal.append([r.get_one_line_csv() for r in changed], sync)
+        if self.journal.needs_compaction(len(self.results)):
+            self.journal.compact([v.get_one_line_csv() for v in self.results.values()])
+
+    def add_images(self, files: [str], mtimes: List[float] | None = None) -> None:
+        # mtimes are the modification times of the files if the caller already stat'ed them
+        with self.lock:
+            for f, mtime in zip(files, mtimes or itertools.repeat(None)):
+                self.__track(Result(f, self.result_type, mtime=mtime))
+            self.__buffer([self.results[f] for f in files])
 
-        self.__buffer()
+    def detection_started(self, files):
+        with self.lock:
+            for f in files:
+                self.results[f].detection_started()
+
+    def close(self) -> None:
+        self.closing.set()
+        if self.sync_thread is not None:
+            self.sync_thread.join()
+        self.uploader.stop()
+        with self.lock:
+            self.journal.close()
@@ -0,0 +1,73 @@
+import os
+import time
+from typing import List
+
+
+class ResultJournal:
+    # every changed result is appended as one line to the journal, the checkpoint (the old buffer file format)
+    # is only rewritten when the journal got too long. Loading replays the checkpoint and then the journal,
+    # the last line of an image wins.
+
+    def __init__(self, checkpoint_file: str, sync_interval: float = 1.0, compact_after: int = 10000):
+        self.checkpoint_file = checkpoint_file
+        self.journal_file = checkpoint_file + ".journal"
+        self.sync_interval = sync_interval
+        self.compact_after = compact_after
+        self.entries = 0
+        self.__last_sync = time.time()
+        self.__file = None
+
+    def load(self) -> List[str]:
+        lines = []
+        for file in [self.checkpoint_file, self.journal_file]:
+            if not os.path.exists(file):
+                continue
+            with open(file, 'r') as f:
+                for line in f:
+                    # a line without newline was cut off by a crash while it was written
+                    if line.endswith("\n") and len(line.strip()) > 0:
+                        lines.append(line)
+                        if file == self.journal_file:
+                            self.entries += 1
+        return lines
+
+    def append(self, lines: List[str], sync: bool = False) -> None:
+        if len(lines) == 0 and not sync:
+            return
+        if self.__file is None:
+            self.__file = open(self.journal_file, 'a')
+        self.__file.writelines(lines)
+        self.__file.flush()
+        self.entries += len(lines)
+        if sync or time.time() - self.__last_sync >= self.sync_interval:
+            self.sync()
+
+    def sync(self) -> None:
+        if self.__file is not None:
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+        self.__last_sync = time.time()
+
+    def needs_compaction(self, live_entries: int) -> bool:
+        # compacting only after as many journal lines as there are results keeps the cost per event constant
+        return self.entries > max(self.compact_after, live_entries)
+
+    def compact(self, lines: List[str]) -> None:
+        tmp = self.checkpoint_file + ".tmp"
+        with open(tmp, 'w') as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_file)
+        # a crash before the journal is truncated only replays lines that are already in the checkpoint
+        if self.__file is not None:
+            self.__file.close()
+        self.__file = open(self.journal_file, 'w')
+        self.entries = 0
+        self.sync()
+
+    def close(self) -> None:
+        if self.__file is not None:
+            self.sync()
+            self.__file.close()
+            self.__file = None
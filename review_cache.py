@@ -0,0 +1,137 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+class ReviewCache:
+    # compressed renditions of the images waiting for a manual review: the frame downscaled to frame_size and a
+    # montage of the text regions CRAFT found, so a reviewer downloads tens of kilobytes instead of the original.
+    # The renditions are kept on disk, the least recently used ones are removed once they exceed max_bytes.
+    KINDS = ["frame", "crops"]
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 2 ** 20, frame_size: int = 1280, crop_height: int = 120,
+                 max_crops: int = 8, margin: float = 0.5, quality: int = 75):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.frame_size = frame_size
+        self.crop_height = crop_height
+        self.max_crops = max_crops
+        self.margin = margin
+        self.quality = quality
+        self.lock = threading.Lock()
+        # file name -> size, least recently used first
+        self.files: OrderedDict[str, int] = OrderedDict()
+        self.size = 0
+        os.makedirs(directory, exist_ok=True)
+        entries = [e for e in os.scandir(directory) if e.is_file() and e.name.endswith(".jpg")]
+        for e in sorted(entries, key=lambda e: e.stat().st_mtime):
+            self.files[e.name] = e.stat().st_size
+            self.size += e.stat().st_size
+
+    @staticmethod
+    def file_name(image: str, kind: str) -> str:
+        return "{}.{}.jpg".format(hashlib.sha1(os.path.abspath(image).encode("utf-8")).hexdigest(), kind)
+
+    def add_record(self, image: str, frame: np.ndarray | None, record: dict) -> None:
+        # detector record listener, renders the renditions before the image is waiting for the review
+        try:
+            self.add(image, frame, record["polys"], record.get("scores"))
+        except Exception as e:
+            logging.error("Could not render review images of {}: {}".format(image, e))
+
+    def add(self, image: str, frame: np.ndarray | None, polys: list, scores: list[float] | None = None) -> None:
+        # frame is the decoded BGR image, None reads it from the file (e.g. for cached detection results)
+        if frame is None:
+            frame = cv2.imread(image)
+            if frame is None:
+                return
+        self.__write(self.file_name(image, "frame"), self.__frame(frame))
+        crops = self.__crops(frame, polys, scores)
+        if crops is not None:
+            self.__write(self.file_name(image, "crops"), crops)
+
+    def get(self, image: str, kind: str) -> str | None:
+        # path of the rendition, a missing frame is rendered from the original, without regions there are no crops
+        name = self.file_name(image, kind)
+        with self.lock:
+            if name in self.files:
+                self.files.move_to_end(name)
+                return os.path.join(self.directory, name)
+        if kind == "frame" and os.path.isfile(image):
+            self.add(image, None, [])
+            with self.lock:
+                if name in self.files:
+                    return os.path.join(self.directory, name)
+        return None
+
+    def discard(self, image: str) -> None:
+        # the renditions are not needed anymore once the image is reviewed
+        with self.lock:
+            for kind in self.KINDS:
+                self.__remove(self.file_name(image, kind))
+
+    def __frame(self, frame: np.ndarray) -> np.ndarray:
+        scale = self.frame_size / max(frame.shape[:2])
+        if scale >= 1:
+            return frame
+        return cv2.resize(frame, (round(frame.shape[1] * scale), round(frame.shape[0] * scale)),
+                          interpolation=cv2.INTER_AREA)
+
+    def __crops(self, frame: np.ndarray, polys: list, scores: list[float] | None) -> np.ndarray | None:
+        # the regions with the highest CRAFT scores, each grown by margin times its height so the whole bib is
+        # visible, scaled to crop_height and stacked below each other
+        order = range(len(polys))
+        if scores is not None and len(scores) == len(polys):
+            order = sorted(order, key=lambda i: -scores[i])
+        crops = []
+        for i in list(order)[:self.max_crops]:
+            poly = np.asarray(polys[i], dtype=np.float32).reshape(-1, 2)
+            x0, y0 = poly.min(axis=0)
+            x1, y1 = poly.max(axis=0)
+            grow = (y1 - y0) * self.margin
+            x0, y0 = max(int(x0 - grow), 0), max(int(y0 - grow), 0)
+            x1, y1 = min(int(np.ceil(x1 + grow)), frame.shape[1]), min(int(np.ceil(y1 + grow)), frame.shape[0])
+            if x1 <= x0 or y1 <= y0:
+                continue
+            crop = frame[y0:y1, x0:x1]
+            width = min(round(crop.shape[1] * self.crop_height / crop.shape[0]), self.frame_size)
+            crops.append(cv2.resize(crop, (width, self.crop_height), interpolation=cv2.INTER_AREA))
+        if len(crops) == 0:
+            return None
+        montage = np.full((len(crops) * self.crop_height, max(c.shape[1] for c in crops), 3), 255, dtype=np.uint8)
+        for i, crop in enumerate(crops):
+            montage[i * self.crop_height:(i + 1) * self.crop_height, :crop.shape[1]] = crop
+        return montage
+
+    def __write(self, name: str, image: np.ndarray) -> None:
+        ok, data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return
+        path = os.path.join(self.directory, name)
+        # written under a temporary name, a reviewer never downloads a half written rendition
+        tmp = "{}.{}.tmp".format(path, threading.get_ident())
+        with open(tmp, "wb") as f:
+            f.write(data.tobytes())
+        os.replace(tmp, path)
+        with self.lock:
+            self.__remove(name, delete=False)
+            self.files[name] = len(data)
+            self.size += len(data)
+            while self.size > self.max_bytes and len(self.files) > 1:
+                self.__remove(next(iter(self.files)))
+
+    def __remove(self, name: str, delete: bool = True) -> None:
+        size = self.files.pop(name, None)
+        if size is None:
+            return
+        self.size -= size
+        if delete:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
@@ -1,80 +1,239 @@
+import hashlib
 import json
 import os
 import re
 import socketserver
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from os.path import exists
+from urllib.parse import quote, unquote
 
+import metrics
 from client import ApiClient
 from detection.BibNumberDetector import BibNumberDetector
+from detection.ResultCache import ResultCache
+from detection.service.IndexedBibNumberService import IndexedBibNumberService
+from detection_pipeline import DetectionPipeline
 from file_system_watcher import FileSystemWatcher
+from job_table import JobTable, JobWorker
+from result import InvalidStateException
 from result_collector import ResultCollector, ResultType
+from review_cache import ReviewCache
 
 hostName = "localhost"
 serverPort = 8081
+detectionWorkers = 2
+detectionQueueSize = 256
+# images of a burst differing in at most this many hash bits reuse the text regions of the previous shot,
+# None detects every image on its own
+burstDistance = None
+# csv with the registered bib numbers, edits are picked up without restarting the server
+bibRegistry = None
+# downscaled frames and bib crops sent to the reviewers instead of the originals, and how many of the next
+# images the browser is told to prefetch
+reviewCacheDir = "temp/review"
+reviewCacheBytes = 256 * 2 ** 20
+reviewPrefetch = 3
+# SQLite job table on a shared path, other hosts help with the detection by running worker.py on it
+jobTable = None
+
+
+class StaticFile:
+    def __init__(self, path: str, content_type: str):
+        with open(path, 'rb') as f:
+            self.content = f.read()
+        self.content_type = content_type
+        self.mtime = os.path.getmtime(path)
+        self.etag = f'"{hashlib.sha1(self.content).hexdigest()}"'
 
 
 # noinspection PyPep8Naming
 class Server(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps the connections of the reviewers open between requests
+    protocol_version = "HTTP/1.1"
     results: ResultCollector
+    index: StaticFile
+    review: ReviewCache
     post_regex = re.compile('/image/([^/]+)')
+    review_regex = re.compile('/review/([^/]+)/(frame|crops|original)$')
 
     def __init__(self, request: bytes, client_address: (str, int), server: socketserver.BaseServer,
-                 results: ResultCollector):
+                 results: ResultCollector, index: StaticFile, review: ReviewCache):
         self.results = results
+        self.index = index
+        self.review = review
         super().__init__(request, client_address, server)
 
     def do_GET(self):
-        file = "index.html"
-        response_type = "text/html"
-        if self.path == '/image':
-            response_type = "image/jpeg"
-            file = self.results.get_manual_pending()
-
+        if self.path == '/metrics':
+            self.__send_metrics()
+            return
+        match = Server.review_regex.match(self.path)
+        if match is not None:
+            self.__send_review(unquote(match.group(1)), match.group(2))
+            return
+        if self.path == '/review/next':
+            self.__send_json([os.path.basename(f) for f in self.results.peek_manual_pending(reviewPrefetch)])
+            return
+        if self.path != '/image':
+            self.__send_static(self.index)
+            return
+        file = self.results.get_manual_pending()
         if file is not None and exists(file):
-            self.send_response(200)
-            self.send_header("Content-type", response_type)
-            if self.path == '/image':
-                self.send_header("Content-Disposition", f'attachment; filename="{os.path.split(file)[1]}"')
+            # the reviewer is sent to the small rendition, which the browser already has if it was prefetched,
+            # the next images are announced so they are loaded while the reviewer is still typing
+            prefetch = []
+            for f in self.results.peek_manual_pending(reviewPrefetch):
+                name = quote(os.path.basename(f))
+                prefetch += [f"</review/{name}/frame>; rel=prefetch", f"</review/{name}/crops>; rel=prefetch"]
+            self.send_response(303)
+            self.send_header("Location", f"/review/{quote(os.path.basename(file))}/frame")
+            if len(prefetch) > 0:
+                self.send_header("Link", ", ".join(prefetch))
+            self.send_header("Content-Length", "0")
             self.end_headers()
-            with open(file, 'rb') as f:
-                self.wfile.write(f.read())
         else:
             self.send_error(404, "Aktuell gibt es keine Bilder")
 
     def do_POST(self):
         match = Server.post_regex.match(self.path)
         if match is not None:
+            name = unquote(match.group(1))
+            if os.path.basename(name) != name:
+                self.send_error(404, f"image {name} does not exist")
+                return
             content_length = int(self.headers['Content-Length'])
             content_str = self.rfile.read(content_length)
             nums = json.loads(content_str)
-            self.results.add_manually(nums, str(match.groups()[0]))
+            try:
+                self.results.add_manually(nums, name)
+            except (KeyError, InvalidStateException):
+                self.send_error(409, f"image {name} is not waiting for a manual result")
+                return
+            self.review.discard(os.path.join(self.results.image_dir, name))
+            self.send_response(204)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
         else:
             self.send_error(400, f"path ({self.path}) doesn't match required format: {Server.post_regex.pattern}")
 
+    def __send_review(self, name: str, kind: str):
+        # the renditions (or the original) of an image of the image directory, no matter in which state it is
+        file = os.path.join(self.results.image_dir, name)
+        if os.path.basename(name) != name or not os.path.isfile(file):
+            self.send_error(404, f"image {name} does not exist")
+            return
+        rendition = file if kind == "original" else self.review.get(file, kind)
+        if rendition is None:
+            self.send_error(404, f"image {name} has no {kind}")
+            return
+        # a rendition never changes, so a prefetched one is used without asking again
+        headers = {"Cache-Control": "private, max-age=86400"}
+        if self.results.is_partial(os.path.normpath(file)):
+            # the detection ran out of time, the reviewer has to look at the whole image
+            headers["X-Detection"] = "partial"
+        self.__send_file(rendition, "image/jpeg", name, headers)
+
+    def __send_json(self, value):
+        content = json.dumps(value).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(content)
+
+    def __send_metrics(self):
+        content = metrics.REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def __not_modified(self, etag: str, mtime: float) -> bool:
+        if self.headers["If-None-Match"] is not None:
+            return etag in [t.strip() for t in self.headers["If-None-Match"].split(",")] or \
+                self.headers["If-None-Match"].strip() == "*"
+        if self.headers["If-Modified-Since"] is not None:
+            try:
+                return int(mtime) <= parsedate_to_datetime(self.headers["If-Modified-Since"]).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def __send_validators(self, etag: str, mtime: float) -> bool:
+        # sends 304 and returns True if the client already has this version
+        if self.__not_modified(etag, mtime):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return True
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", formatdate(mtime, usegmt=True))
+        return False
+
+    def __send_static(self, static: StaticFile):
+        if self.__send_validators(static.etag, static.mtime):
+            return
+        self.send_header("Content-type", static.content_type)
+        self.send_header("Content-Length", str(len(static.content)))
+        self.end_headers()
+        self.wfile.write(static.content)
+
+    def __send_file(self, file: str, content_type: str, filename: str | None = None,
+                    headers: dict[str, str] | None = None):
+        with open(file, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if self.__send_validators(f'"{st.st_mtime_ns:x}-{st.st_size:x}"', st.st_mtime):
+                return
+            self.send_header("Content-type", content_type)
+            self.send_header("Content-Length", str(st.st_size))
+            self.send_header("Content-Disposition", f'attachment; filename="{filename or os.path.split(file)[1]}"')
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            # the file goes from the page cache to the socket without being copied through python
+            self.connection.sendfile(f)
+
     @staticmethod
-    def construct(results: ResultCollector, ):
+    def construct(results: ResultCollector, index: StaticFile, review: ReviewCache):
         def __b(request: bytes, client_address: (str, int), server: socketserver.BaseServer):
-            return Server(request, client_address, server, results)
+            return Server(request, client_address, server, results, index, review)
 
         return __b
 
 
 def main():
+    # counters and stage timings for /metrics
+    metrics.enable()
     img_dir = "D:/LaufendHelfen/ai/res/test/imgs/imgdirectory"
     api_client = ApiClient("https://api.laufendhelfen.org/timecapture/tag_id", "AI", "aVsp4Lhita1A+")
-    results = ResultCollector(api_client, ResultType.FINISH, "buffer.csv", img_dir)
+    jobs = JobTable(jobTable) if jobTable else None
+    results = ResultCollector(api_client, ResultType.FINISH, "buffer.csv", img_dir, jobs=jobs)
     watcher = FileSystemWatcher(img_dir, results)
 
-    number_detector = BibNumberDetector("temp/ai", 1)
-
-    def detect(f):
-        results.detection_started(f)
-        results.add_ai(number_detector.detect_bib_numbers(f))
-
-    watcher.add_listener(detect)
+    # re-detected images after a restart and duplicate uploads are answered from the cache
+    bib_number_svc = IndexedBibNumberService.from_csv(bibRegistry, fuzzy=True) if bibRegistry else None
+    number_detector = BibNumberDetector("temp/ai", detectionWorkers, CACHE=ResultCache("ai_cache.sqlite"),
+                                        BIB_NUMBER_SVC=bib_number_svc, BURST_DISTANCE=burstDistance)
+    # the review renditions are rendered from the decoded image and the regions CRAFT found, before the image
+    # is handed to the reviewers
+    review = ReviewCache(reviewCacheDir, reviewCacheBytes)
+    number_detector.add_record_listener(review.add_record)
+    # detection runs on its own workers, the watcher only enqueues the new files
+    if jobs is None:
+        pipeline = DetectionPipeline(number_detector, results, detectionWorkers, detectionQueueSize)
+        watcher.add_listener(pipeline.submit)
+    else:
+        # this host claims images from the job table like the workers of the other hosts
+        pipeline = JobWorker(number_detector, jobs, detectionWorkers)
+        watcher.add_listener(results.queue_detection)
 
-    web_server = HTTPServer((hostName, serverPort), Server.construct(results))
+    # every request gets its own thread, a slow download does not block the other reviewers
+    web_server = ThreadingHTTPServer((hostName, serverPort),
+                                     Server.construct(results, StaticFile("index.html", "text/html"), review))
     print(f"Server started http://{hostName}:{serverPort}")
 
     try:
@@ -83,7 +242,13 @@ def main():
         pass
 
     watcher.stop()
+    pipeline.stop()
+    number_detector.close()
     web_server.server_close()
+    results.close()
+    if jobs is not None:
+        jobs.close()
+    api_client.close()
     print("Server stopped.")
 
 
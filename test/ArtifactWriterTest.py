@@ -0,0 +1,46 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from detection.ArtifactWriter import ArtifactLevel, ArtifactWriter
+
+
+class ArtifactWriterTest(unittest.TestCase):
+    record = {"bibs": [518], "texts": ["518", ""]}
+
+    def test_summary(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            writer = ArtifactWriter(tmp, ArtifactLevel.SUMMARY)
+            writer.summary("a.jpg", self.record, False)
+            writer.regions("a.jpg", [np.zeros((10, 20, 3), dtype=np.uint8)], None, {})
+            writer.summary("b.jpg", self.record, True)
+            writer.close()
+
+            with open(os.path.join(tmp, "results.jsonl")) as f:
+                lines = [json.loads(line) for line in f]
+            self.assertEqual([{"image": "a.jpg", "bibs": [518], "texts": ["518", ""], "cached": False},
+                              {"image": "b.jpg", "bibs": [518], "texts": ["518", ""], "cached": True}], lines)
+            # crops are not written at the summary level
+            self.assertEqual(["results.jsonl"], os.listdir(tmp))
+
+    def test_crops(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            writer = ArtifactWriter(tmp, ArtifactLevel.CROPS, QUEUE_SIZE=1)
+            writer.regions("a.jpg", [None, np.zeros((10, 20, 3), dtype=np.uint8)], None, {})
+            writer.flush()
+            self.assertEqual(["crop_1.png"], os.listdir(os.path.join(tmp, "a.jpg", "a_crops")))
+            writer.close()
+
+    def test_none(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            writer = ArtifactWriter(tmp, ArtifactLevel.NONE)
+            writer.summary("a.jpg", self.record, False)
+            writer.close()
+            self.assertEqual([], os.listdir(tmp))
+
+
+if __name__ == '__main__':
+    unittest.main()
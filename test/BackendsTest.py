@@ -0,0 +1,32 @@
+import importlib.util
+import unittest
+
+import craft_text_detector.image_utils as image_utils
+import cv2
+import numpy as np
+
+from detection import backends
+
+
+@unittest.skipIf(importlib.util.find_spec("onnxruntime") is None, "onnxruntime is not installed")
+class BackendsTest(unittest.TestCase):
+    def setUp(self):
+        # a fixture image preprocessed the way get_predictions does it, small to keep the forward passes short
+        image = cv2.cvtColor(cv2.imread("res/test/imgs/test1.jpg"), cv2.COLOR_BGR2RGB)
+        resized, _, _ = image_utils.resize_aspect_ratio(image, 320, interpolation=cv2.INTER_LINEAR)
+        x = image_utils.normalizeMeanVariance(resized).transpose(2, 0, 1)[np.newaxis]
+        self.x = np.ascontiguousarray(x, dtype=np.float32)
+
+    def test_onnx_matches_torch(self):
+        torch_text, torch_link = backends.get_backend("torch").forward(self.x)
+        onnx_text, onnx_link = backends.get_backend("onnx").forward(self.x)
+
+        # the same graph in full precision, only the order of the float operations differs
+        self.assertEqual(torch_text.shape, onnx_text.shape)
+        self.assertEqual(torch_link.shape, onnx_link.shape)
+        np.testing.assert_allclose(onnx_text, torch_text, atol=1e-4)
+        np.testing.assert_allclose(onnx_link, torch_link, atol=1e-4)
+
+
+if __name__ == '__main__':
+    unittest.main()
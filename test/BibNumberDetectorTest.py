@@ -1,6 +1,41 @@
 import os.path
+import tempfile
 import unittest
+
+import cv2
+import numpy as np
+
+import metrics
 from detection.BibNumberDetector import BibNumberDetector
+from detection.ResultCache import ResultCache
+
+
+class _Predictor:
+    # regions text regions side by side in the middle of every image instead of CRAFT
+    def __init__(self, regions: int = 1):
+        self.regions = regions
+        self.calls = 0
+
+    def predict(self, image: np.ndarray) -> dict:
+        self.calls += 1
+        h, w = image.shape[:2]
+        polys = []
+        for i in range(self.regions):
+            x0, x1 = w * (0.1 + 0.2 * i), w * (0.2 + 0.2 * i)
+            polys.append(np.array([[x0, h * 0.4], [x1, h * 0.4], [x1, h * 0.5], [x0, h * 0.5]]))
+        return {"polys": polys, "scores": [0.9] * self.regions, "heatmaps": {}}
+
+
+class _Ocr:
+    # returns the next of texts for every crop instead of tesseract
+    def __init__(self, texts: list[str]):
+        self.texts = texts
+
+    def images_to_strings(self, imgs: list) -> list[str]:
+        return [self.texts.pop(0) if img is not None else "" for img in imgs]
+
+    def close(self):
+        pass
 
 
 class BibNumberDetectorTest(unittest.TestCase):
@@ -10,6 +45,37 @@ class BibNumberDetectorTest(unittest.TestCase):
 
         self.assertListEqual([518], bibs)
 
+    def test_detect_bib_number_single_from_bytes(self):
+        det = BibNumberDetector("res/test/output")
+        with open("res/test/imgs/test1.jpg", "rb") as f:
+            bibs = det.detect_bib_numbers_single(f.read(), "test1.jpg")
+
+        self.assertListEqual([518], bibs)
+
+    def test_detect_bib_number_single_cached(self):
+        det = BibNumberDetector("res/test/output", CACHE=ResultCache(":memory:"))
+        det.detect_bib_numbers_single("res/test/imgs/test1.jpg")
+        bibs = det.detect_bib_numbers_single("res/test/imgs/imgdirectory/test1.jpg")
+
+        self.assertListEqual([518], bibs)
+        self.assertEqual(1, det.cache_hits)
+
+    def test_detect_bib_number_single_shares_backend(self):
+        first = BibNumberDetector("res/test/output")
+        second = BibNumberDetector("res/test/output")
+
+        self.assertListEqual([518], first.detect_bib_numbers_single("res/test/imgs/test1.jpg"))
+        self.assertListEqual([518], second.detect_bib_numbers_single("res/test/imgs/test1.jpg"))
+        self.assertIs(first.batcher.backend, second.batcher.backend)
+
+    def test_detect_image_with_deadline(self):
+        det = BibNumberDetector("res/test/output", TIME_BUDGET=30.0, MAX_BIBS=1)
+        record = det.detect_image("res/test/imgs/test1.jpg")
+
+        # the bib number is among the best ranked regions, the rest is not read once it is found
+        self.assertListEqual([518], record["bibs"])
+        self.assertFalse(record["partial"])
+
     def test_detect_bib_number_single_fail(self):
         det = BibNumberDetector("res/test/output")
         bibs = det.detect_bib_numbers_single("res/test/imgs/test_fail.jpg")
@@ -29,6 +95,108 @@ class BibNumberDetectorTest(unittest.TestCase):
         self.assertDictEqual({os.path.normpath('res/test/imgs/imgdirectory/test1.jpg'): [518],
                               os.path.normpath('res/test/imgs/imgdirectory/test2.jpg'): [376, 246]}, bibs)
 
+    def test_region_filter_default(self):
+        first = BibNumberDetector("res/test/output")
+        second = BibNumberDetector("res/test/output")
+
+        # every detector gets a filter of its own, unless filtering is turned off
+        self.assertIsNotNone(first.region_filter)
+        self.assertIsNot(first.region_filter, second.region_filter)
+        self.assertIsNone(BibNumberDetector("res/test/output", FILTER_REGIONS=False).region_filter)
+
+    def test_detect_image_writes_no_artifacts_by_default(self):
+        with tempfile.TemporaryDirectory() as out:
+            det = BibNumberDetector(out, FILTER_REGIONS=False)
+            det.predictor = _Predictor()
+            det.ocr = _Ocr(["518"])
+            det.detect_image("res/test/imgs/test1.jpg")
+            det.close()
+
+            self.assertListEqual([], os.listdir(out))
+
+    def test_detect_image_with_metrics(self):
+        metrics.enable()
+        self.addCleanup(metrics.enable, False)
+        det = BibNumberDetector("res/test/output", FILTER_REGIONS=False, TIME_BUDGET=30.0, OCR_CHUNK=2)
+        det.predictor = _Predictor(3)
+        det.ocr = _Ocr(["518", "", ""])
+        boxes = metrics.OCR_BOXES.values.get((), [None, 0])[1]
+        calls = metrics.OCR_CALLS.values.get((), [None, 0])[1]
+        record = det.detect_image("res/test/imgs/test1.jpg")
+
+        # the crop arrays are counted without comparing them to None elementwise, three regions in two OCR calls
+        self.assertListEqual([518], record["bibs"])
+        self.assertEqual(boxes + 3, metrics.OCR_BOXES.values[()][1])
+        self.assertEqual(calls + 2, metrics.OCR_CALLS.values[()][1])
+
+    def test_detect_image_burst_carries_bibs_one_shot(self):
+        det = BibNumberDetector("res/test/output", FILTER_REGIONS=False, BURST_DISTANCE=8)
+        det.predictor = _Predictor()
+        det.ocr = _Ocr(["101", "202", "", ""])
+        with open("res/test/imgs/test1.jpg", "rb") as f:
+            data = f.read()
+        bibs = [det.detect_image(data, f"shot{i}.jpg")["bibs"] for i in range(4)]
+
+        # a static camera: every shot matches the one before, only bibs read in that shot itself are carried over
+        self.assertListEqual([[101], [202, 101], [202], []], bibs)
+        self.assertEqual(3, det.frames_reused)
+
+    def test_detect_image_burst_is_not_cached(self):
+        cache = ResultCache(":memory:")
+        det = BibNumberDetector("res/test/output", FILTER_REGIONS=False, BURST_DISTANCE=8, CACHE=cache)
+        det.predictor = _Predictor()
+        det.ocr = _Ocr(["101", ""])
+        # two shots of a burst: nearly the same image, but other bytes
+        img = cv2.imread("res/test/imgs/test1.jpg")
+        first, second = [cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, q])[1].tobytes() for q in (95, 90)]
+        det.detect_image(first, "shot0.jpg")
+        self.assertListEqual([101], det.detect_image(second, "shot1.jpg")["bibs"])
+
+        # the reused record holds OCR on the regions of the first shot, it is not what a plain run would find
+        plain = BibNumberDetector("res/test/output", FILTER_REGIONS=False, CACHE=cache)
+        plain.predictor = _Predictor()
+        plain.ocr = _Ocr(["303"])
+        self.assertListEqual([303], plain.detect_image(second, "shot1.jpg")["bibs"])
+        self.assertEqual(0, plain.cache_hits)
+
+    def test_detect_image_burst_runs_craft_again(self):
+        det = BibNumberDetector("res/test/output", FILTER_REGIONS=False, BURST_DISTANCE=8, BURST_DEPTH=2)
+        det.predictor = _Predictor()
+        det.ocr = _Ocr([""] * 7)
+        with open("res/test/imgs/test1.jpg", "rb") as f:
+            data = f.read()
+        depths = [det.detect_image(data, f"shot{i}.jpg").get("burst", 0) for i in range(7)]
+
+        # a static camera: CRAFT runs on every third shot, so runners entering the frame are found
+        self.assertListEqual([0, 1, 2, 0, 1, 2, 0], depths)
+        self.assertEqual(3, det.predictor.calls)
+
+    def test_detect_image_stops_at_max_bibs(self):
+        det = BibNumberDetector("res/test/output", FILTER_REGIONS=False, MAX_BIBS=2, OCR_CHUNK=4,
+                                CACHE=ResultCache(":memory:"))
+        det.predictor = _Predictor(4)
+        det.ocr = _Ocr(["101", "202", "303", "404"])
+        record = det.detect_image("res/test/imgs/test1.jpg")
+
+        # the chunk is cut to the two missing bib numbers, the other regions are not sent to OCR at all
+        self.assertListEqual([101, 202], record["bibs"])
+        self.assertListEqual(["303", "404"], det.ocr.texts)
+        self.assertEqual(2, record["skipped"])
+        self.assertFalse(record["partial"])
+        self.assertListEqual([101, 202], det.detect_image("res/test/imgs/test1.jpg")["bibs"])
+        self.assertEqual(1, det.cache_hits)
+
+    def test_detect_image_max_bibs_is_not_partial(self):
+        det = BibNumberDetector("res/test/output", FILTER_REGIONS=False, TIME_BUDGET=0.0, MAX_BIBS=1, OCR_CHUNK=4)
+        det.predictor = _Predictor(4)
+        det.ocr = _Ocr(["101", "202", "303", "404"])
+        record = det.detect_image("res/test/imgs/test1.jpg")
+
+        # the budget is used up as well, but reading stopped because the bib number was found
+        self.assertListEqual([101], record["bibs"])
+        self.assertEqual(3, record["skipped"])
+        self.assertFalse(record["partial"])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from detection_pipeline import DetectionPipeline
+from result import ResultState, ResultType
+from result_collector import ResultCollector
+
+
+class _Client:
+    def send(self, pending: [str]) -> bool:
+        return True
+
+
+class _Detector:
+    def __init__(self):
+        self.order = []
+        self.release = threading.Event()
+
+    def detect_image(self, img_path: str) -> dict:
+        self.release.wait()
+        self.order.append(img_path)
+        if img_path.endswith("broken.jpg"):
+            raise ValueError("broken image")
+        return {"bibs": [int(os.path.basename(img_path)[0])], "partial": img_path.endswith("new.jpg")}
+
+
+class DetectionPipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.results = ResultCollector(_Client(), ResultType.FINISH, os.path.join(self.dir.name, "buffer.csv"),
+                                       self.dir.name)
+
+    def tearDown(self):
+        self.results.close()
+        self.dir.cleanup()
+
+    def image(self, name: str, age: int) -> str:
+        path = os.path.join(self.dir.name, name)
+        with open(path, "wb"):
+            pass
+        t = time.time() - age
+        os.utime(path, (t, t))
+        return path
+
+    def test_newest_images_first(self):
+        detector = _Detector()
+        pipeline = DetectionPipeline(detector, self.results, workers=1)
+        first = self.image("0_first.jpg", 0)
+        self.results.add_images([first])
+        pipeline.submit([first])
+        # the worker is blocked on the first image while the others are queued
+        time.sleep(0.1)
+        files = [self.image("1_old.jpg", 30), self.image("2_new.jpg", 10), self.image("broken.jpg", 20)]
+        self.results.add_images(files)
+        pipeline.submit(files)
+        detector.release.set()
+        pipeline.stop()
+
+        self.assertEqual([first, files[1], files[2], files[0]], detector.order)
+        self.assertEqual(4, self.results.count(ResultState.PENDING_MANUALLY))
+        # the image cut short by the time budget is flagged for the reviewers
+        self.assertEqual([False, False, True, False], [self.results.is_partial(f) for f in [first] + files])
+
+
+if __name__ == '__main__':
+    unittest.main()
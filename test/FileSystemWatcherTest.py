@@ -0,0 +1,83 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from typing import List
+
+from file_system_watcher import FileSystemWatcher
+
+
+class _Collector:
+    def __init__(self):
+        self.added = []
+        self.mtimes = []
+
+    def needs_detection(self, img: str) -> bool:
+        return img not in self.added
+
+    def add_images(self, files: [str], mtimes: List[float] | None = None) -> None:
+        self.added += files
+        self.mtimes += mtimes
+
+
+class FileSystemWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.dir.name, "existing.jpg"), "wb") as f:
+            f.write(b"0")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def watch(self, use_inotify: bool):
+        collector = _Collector()
+        emitted = []
+        emitted_mtimes = []
+        event = threading.Event()
+        watcher = FileSystemWatcher(self.dir.name, collector, debounce=0.5, poll_interval=0.1,
+                                    use_inotify=use_inotify)
+
+        def listener(files, mtimes):
+            emitted.append(files)
+            emitted_mtimes.extend(mtimes)
+            event.set()
+
+        watcher.add_listener(listener)
+        try:
+            self.assertTrue(event.wait(5))
+            self.assertEqual([[os.path.join(self.dir.name, "existing.jpg")]], emitted)
+            event.clear()
+
+            path = os.path.join(self.dir.name, "new.jpg")
+            with open(path, "wb") as f:
+                f.write(b"1")
+                f.flush()
+                # still being written, must not be emitted yet
+                time.sleep(0.2)
+                f.write(b"2")
+                f.flush()
+                time.sleep(0.2)
+                self.assertEqual(1, len(emitted))
+            self.assertTrue(event.wait(5))
+            self.assertEqual([path], emitted[1])
+            # the modification times come from the stat calls of the watcher
+            self.assertEqual([os.path.getmtime(f) for f in collector.added], collector.mtimes)
+            # the listeners get the same times and do not have to stat the files again
+            self.assertEqual(collector.mtimes, emitted_mtimes)
+            time.sleep(0.8)
+            self.assertEqual(2, len(emitted))
+        finally:
+            watcher.stop()
+            watcher.watcher.join()
+
+    def test_polling(self):
+        self.watch(False)
+
+    @unittest.skipUnless(os.name == "posix" and os.uname().sysname == "Linux", "inotify is only available on Linux")
+    def test_inotify(self):
+        self.watch(True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from detection.FrameIndex import FrameIndex, dhash
+
+
+def frame(seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 255, (12, 16, 3), dtype=np.uint8)
+    return cv2.resize(small, (1600, 1200), interpolation=cv2.INTER_CUBIC)
+
+
+class FrameIndexTest(unittest.TestCase):
+    def test_burst_shot_is_found(self):
+        index = FrameIndex()
+        first = frame(0)
+        index.add(dhash(first), first.shape, {"bibs": [518]})
+
+        # the next shot of the burst: sensor noise and a runner moved a few pixels
+        rng = np.random.default_rng(1)
+        second = np.clip(first.astype(int) + rng.integers(-3, 4, first.shape), 0, 255).astype(np.uint8)
+        second = np.roll(second, 3, axis=1)
+        self.assertEqual({"bibs": [518]}, index.lookup(dhash(second), second.shape))
+
+    def test_other_frames_are_not_found(self):
+        index = FrameIndex()
+        first = frame(0)
+        index.add(dhash(first), first.shape, {"bibs": [518]})
+
+        other = frame(2)
+        self.assertIsNone(index.lookup(dhash(other), other.shape))
+        smaller = cv2.resize(first, (800, 600))
+        self.assertIsNone(index.lookup(dhash(smaller), smaller.shape))
+
+    def test_only_recent_frames_are_kept(self):
+        index = FrameIndex(max_frames=2)
+        frames = [frame(seed) for seed in range(3)]
+        for i, f in enumerate(frames):
+            index.add(dhash(f), f.shape, {"bibs": [i]})
+        self.assertIsNone(index.lookup(dhash(frames[0]), frames[0].shape))
+        self.assertEqual({"bibs": [2]}, index.lookup(dhash(frames[2]), frames[2].shape))
+
+    def test_most_recent_frame_wins_a_tie(self):
+        index = FrameIndex()
+        first = frame(0)
+        index.add(dhash(first), first.shape, {"bibs": [1]})
+        index.add(dhash(first), first.shape, {"bibs": [2]})
+        self.assertEqual({"bibs": [2]}, index.lookup(dhash(first), first.shape))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+import os
+import tempfile
+import unittest
+
+from detection.image_utils import iter_image_files
+
+
+class ImageUtilsTest(unittest.TestCase):
+    def test_iter_image_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, "sub"))
+            for f in ["a.jpg", "b.png", "notes.txt", os.path.join("sub", "c.jpg")]:
+                open(os.path.join(tmp, f), "w").close()
+
+            self.assertEqual({"a.jpg", "b.png", "notes.txt"},
+                             {os.path.relpath(f, tmp) for f in iter_image_files([tmp])})
+            self.assertEqual({"a.jpg", os.path.join("sub", "c.jpg")},
+                             {os.path.relpath(f, tmp) for f in iter_image_files([tmp], True, ["*.jpg"])})
+            # files given explicitly are not filtered
+            self.assertEqual([os.path.join(tmp, "notes.txt")],
+                             list(iter_image_files([os.path.join(tmp, "notes.txt")], patterns=["*.jpg"])))
+
+
+if __name__ == '__main__':
+    unittest.main()
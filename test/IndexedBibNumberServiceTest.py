@@ -0,0 +1,51 @@
+import os
+import tempfile
+import time
+import unittest
+
+from detection.service.IndexedBibNumberService import IndexedBibNumberService
+
+
+class IndexedBibNumberServiceTest(unittest.TestCase):
+    def test_exact_lookup(self):
+        svc = IndexedBibNumberService([3, 17, 30000])
+        self.assertEqual(17, svc.find_number(17))
+        self.assertIsNone(svc.find_number(18))
+        self.assertIsNone(svc.find_number(-1))
+        self.assertIsNone(svc.find_number(40000))
+        self.assertTrue(svc.contains_number(30000))
+        self.assertEqual([3, 30000], svc.find_numbers([3, 4, 30000, 123456]))
+
+    def test_fuzzy_lookup(self):
+        svc = IndexedBibNumberService([71, 150, 156], fuzzy=True)
+        # 11 and 77 differ from 71 in one confusable digit
+        self.assertEqual([71, 71], svc.find_numbers([11, 77]))
+        # exact matches win over corrections
+        self.assertEqual(156, svc.find_number(156))
+        # 158 only corrects to 150, 180 is not confusable with anything registered
+        self.assertEqual(150, svc.find_number(158))
+        self.assertIsNone(svc.find_number(180))
+        self.assertIsNone(IndexedBibNumberService([71]).find_number(11))
+
+    def test_ambiguous_correction(self):
+        # 16 could be 15 or 76
+        svc = IndexedBibNumberService([15, 76], fuzzy=True)
+        self.assertIsNone(svc.find_number(16))
+
+    def test_csv_reload(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_file = os.path.join(tmp, "bibs.csv")
+            with open(csv_file, "w") as f:
+                f.write("bib;name\n12;Anna\n 34 ;Ben\n")
+            svc = IndexedBibNumberService.from_csv(csv_file, reload_interval=0)
+            self.assertEqual([12, 34], svc.get_all_numbers())
+
+            with open(csv_file, "w") as f:
+                f.write("bib,name\n56,Clara\n")
+            os.utime(csv_file, (time.time() + 10, time.time() + 10))
+            self.assertEqual(56, svc.find_number(56))
+            self.assertIsNone(svc.find_number(12))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+
+from job_table import JobTable, JobWorker
+from result import ResultState, ResultType
+from result_collector import ResultCollector
+
+
+class _Client:
+    def send(self, pending: [str]) -> bool:
+        return True
+
+
+class _Detector:
+    def detect_image(self, img_path: str) -> dict:
+        number = int(os.path.basename(img_path).split(".")[0])
+        return {"bibs": [number], "partial": number == 2}
+
+
+def _drain(path: str, name: str) -> list[str]:
+    # a detector process: claims and completes images until the queue is empty
+    jobs = JobTable(path)
+    done = []
+    while True:
+        images = jobs.claim(name, 2)
+        if len(images) == 0:
+            break
+        for image in images:
+            if jobs.complete(name, image, [int(os.path.basename(image).split(".")[0])]):
+                done.append(image)
+    jobs.close()
+    return done
+
+
+class JobTableTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "jobs.sqlite")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def images(self, count: int) -> list[str]:
+        images = []
+        for i in range(count):
+            path = os.path.join(self.dir.name, f"{i}.jpg")
+            with open(path, "wb"):
+                pass
+            # the higher the number the newer the image
+            os.utime(path, (1000 + i, 1000 + i))
+            images.append(path)
+        return images
+
+    def test_claim_newest_first_and_complete(self):
+        jobs = JobTable(self.path)
+        images = self.images(3)
+        self.assertEqual(3, jobs.add(images))
+        self.assertEqual(0, jobs.add(images[:1]))
+
+        self.assertEqual([images[2], images[1]], jobs.claim("a", 2))
+        self.assertEqual([images[0]], jobs.claim("b", 2))
+        self.assertEqual([], jobs.claim("b"))
+        self.assertTrue(jobs.complete("a", images[1], [1]))
+        self.assertFalse(jobs.complete("b", images[2], [2]))
+
+        self.assertEqual([(1, images[1], [1], False)], jobs.finished())
+        self.assertEqual([], jobs.finished(1))
+        self.assertEqual({"done": 1, "leased": 2}, jobs.counts())
+        jobs.close()
+
+    def test_known_mtimes_are_used(self):
+        jobs = JobTable(self.path)
+        images = self.images(3)
+        jobs.add(images, [3.0, 1.0, 2.0])
+
+        self.assertEqual([images[0], images[2], images[1]], jobs.claim("a", 3))
+        jobs.close()
+
+    def test_expired_lease_is_requeued(self):
+        jobs = JobTable(self.path, lease=0.2, max_attempts=2)
+        images = self.images(2)
+        jobs.add(images)
+        self.assertEqual(images[::-1], jobs.claim("a", 2))
+        time.sleep(0.1)
+        self.assertEqual([images[1]], jobs.heartbeat("a", [images[1]]))
+        time.sleep(0.15)
+
+        # only the image without heartbeat went back to the queue, the first worker lost it
+        self.assertEqual([images[0]], jobs.claim("b", 2))
+        self.assertEqual([images[1]], jobs.heartbeat("a", images))
+        self.assertFalse(jobs.complete("a", images[0], [0]))
+        self.assertTrue(jobs.complete("a", images[1], [1]))
+
+        # after max_attempts the image is given up and reviewed without bib numbers
+        time.sleep(0.25)
+        self.assertEqual([], jobs.claim("c"))
+        self.assertEqual([(1, images[1], [1], False), (2, images[0], [], False)], jobs.finished())
+        self.assertEqual({"done": 1, "failed": 1}, jobs.counts())
+        jobs.close()
+
+    def test_release_does_not_count_as_attempt(self):
+        jobs = JobTable(self.path, max_attempts=1)
+        images = self.images(1)
+        jobs.add(images)
+        jobs.claim("a")
+        jobs.release("a")
+
+        self.assertEqual(images, jobs.claim("b"))
+        self.assertTrue(jobs.complete("b", images[0], [0]))
+        jobs.close()
+
+    def test_processes_share_the_queue(self):
+        images = self.images(60)
+        jobs = JobTable(self.path)
+        jobs.add(images)
+        jobs.close()
+
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(4) as pool:
+            done = pool.starmap(_drain, [(self.path, f"worker-{i}") for i in range(4)])
+
+        # every image was detected by exactly one of the processes
+        self.assertEqual(sorted(images), sorted(image for d in done for image in d))
+        jobs = JobTable(self.path)
+        finished = jobs.finished()
+        self.assertEqual(list(range(1, 61)), [seq for seq, _, _, _ in finished])
+        self.assertTrue(all(bibs == [int(os.path.basename(image).split(".")[0])] for _, image, bibs, _ in finished))
+        jobs.close()
+
+    def test_worker_results_reach_the_collector(self):
+        jobs = JobTable(self.path)
+        images = self.images(3)
+        results = ResultCollector(_Client(), ResultType.FINISH, os.path.join(self.dir.name, "buffer.csv"),
+                                  self.dir.name, jobs=jobs, sync_interval=0.05)
+        results.add_images(images)
+        results.queue_detection(images)
+        worker = JobWorker(_Detector(), JobTable(self.path), threads=2, poll_interval=0.05)
+
+        deadline = time.time() + 5
+        while results.count(ResultState.PENDING_MANUALLY) < 3 and time.time() < deadline:
+            time.sleep(0.05)
+        worker.stop()
+        results.close()
+
+        self.assertEqual(3, worker.processed)
+        self.assertEqual(3, results.count(ResultState.PENDING_MANUALLY))
+        self.assertEqual(["1;"], [line[:2] for line in results.results[images[1]].get_csv()])
+        self.assertEqual([False, False, True], [results.is_partial(image) for image in images])
+        # a restarted collector replays the table without touching the images that already left the detection
+        restored = ResultCollector(_Client(), ResultType.FINISH, os.path.join(self.dir.name, "buffer.csv"),
+                                   self.dir.name, jobs=jobs)
+        self.assertEqual(0, restored.sync_jobs())
+        restored.close()
+        worker.jobs.close()
+        jobs.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
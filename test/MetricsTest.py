@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+
+import metrics
+
+
+class MetricsTest(unittest.TestCase):
+    def tearDown(self):
+        metrics.enable(False)
+
+    def test_disabled_records_nothing(self):
+        counter = metrics.Counter("test_total", "test")
+        histogram = metrics.Histogram("test_seconds", "test")
+        counter.inc()
+        histogram.observe(0.2)
+        self.assertEqual({}, counter.values)
+        self.assertEqual({}, histogram.values)
+
+    def test_prometheus_text(self):
+        metrics.enable()
+        registry = metrics.Registry()
+        counter = registry.register(metrics.Counter("test_total", "test counter", ("result",)))
+        histogram = registry.register(metrics.Histogram("test_seconds", "test histogram", ("stage",), (0.1, 1.0)))
+        registry.register(metrics.Gauge("test_results", "test gauge", ("state",), lambda: {("PENDING",): 3}))
+        counter.inc(2, "hit")
+        histogram.observe(0.05, "ocr")
+        histogram.observe(0.5, "ocr")
+        histogram.observe(5, "ocr")
+        text = registry.render()
+        self.assertIn('# TYPE test_total counter\ntest_total{result="hit"} 2\n', text)
+        self.assertIn('test_seconds_bucket{stage="ocr",le="0.1"} 1\n', text)
+        self.assertIn('test_seconds_bucket{stage="ocr",le="1.0"} 2\n', text)
+        self.assertIn('test_seconds_bucket{stage="ocr",le="+Inf"} 3\n', text)
+        self.assertIn('test_seconds_count{stage="ocr"} 3\n', text)
+        self.assertIn('test_results{state="PENDING"} 3\n', text)
+
+    def test_drain_and_merge(self):
+        metrics.enable()
+        worker, parent = metrics.Registry(), metrics.Registry()
+        for registry in [worker, parent]:
+            registry.register(metrics.Counter("test_total", "test"))
+            registry.register(metrics.Histogram("test_seconds", "test", (), (1.0,)))
+            registry.metrics["test_total"].inc(1)
+            registry.metrics["test_seconds"].observe(0.5)
+        parent.merge(worker.drain())
+        self.assertEqual({}, worker.metrics["test_total"].values)
+        self.assertEqual(2, parent.metrics["test_total"].summary())
+        self.assertEqual(2, parent.metrics["test_seconds"].summary()["count"])
+
+    def test_profiler(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            profiler = metrics.Profiler(tmp)
+            self.assertEqual(1, profiler.run("a/img.jpg", len, [0]))
+            # a second image while one is profiled runs unprofiled instead of failing on python 3.12
+            self.assertEqual(2, profiler.run("b/img.jpg", profiler.run, "c/img.jpg", len, [0, 0]))
+
+            # the same name from another directory does not overwrite the first profile
+            files = os.listdir(tmp)
+            self.assertEqual(2, len(files))
+            self.assertTrue(all(f.startswith("img.jpg.{}.".format(os.getpid())) for f in files))
+
+
+if __name__ == '__main__':
+    unittest.main()
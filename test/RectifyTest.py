@@ -0,0 +1,38 @@
+import unittest
+
+import numpy as np
+
+from bench.rectify import rectify_poly_reference, synthetic_image, synthetic_polys
+from detection.rectify import rectify_poly
+
+
+class RectifyTest(unittest.TestCase):
+    def setUp(self):
+        self.img = synthetic_image(600, 900)
+
+    def test_matches_reference(self):
+        for points in [4, 8, 14]:
+            for poly in synthetic_polys(600, 900, 10, points, seed=points):
+                expected = rectify_poly_reference(self.img, poly)
+                actual = rectify_poly(self.img, poly)
+
+                self.assertEqual(expected.shape, actual.shape)
+                self.assertLess(np.abs(expected.astype(int) - actual).mean(), 1)
+
+    def test_irregular_polygon_has_reference_size(self):
+        poly = np.float32([[100, 100], [180, 95], [260, 110], [262, 150], [181, 140], [98, 146]])
+        self.assertEqual(rectify_poly_reference(self.img, poly).shape, rectify_poly(self.img, poly).shape)
+
+    def test_skips_small_crops(self):
+        poly = np.float32([[10, 10], [60, 10], [60, 15], [10, 15]])
+        self.assertIsNone(rectify_poly(self.img, poly, min_height=8))
+        self.assertEqual((5, 50, 3), rectify_poly(self.img, poly).shape)
+
+    def test_does_not_change_polygon(self):
+        poly = np.float32([[100, 100], [180, 100], [180, 140], [100, 140]])
+        rectify_poly(self.img, poly)
+        self.assertEqual(100, poly[0][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
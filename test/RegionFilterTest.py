@@ -0,0 +1,45 @@
+import unittest
+
+import numpy as np
+
+from detection.RegionFilter import RegionFilter, bib_likeness, rank_regions
+
+
+def box(x: float, y: float, w: float, h: float) -> np.ndarray:
+    return np.float32([[x, y], [x + w, y], [x + w, y + h], [x, y + h]])
+
+
+class RegionFilterTest(unittest.TestCase):
+    shape = (1000, 1500, 3)
+
+    def test_accepts_bib_like_region(self):
+        self.assertTrue(RegionFilter().accept(box(700, 500, 90, 40), 0.8, self.shape))
+
+    def test_rejects_long_text_line(self):
+        self.assertFalse(RegionFilter().accept(box(100, 500, 700, 40), 0.8, self.shape))
+
+    def test_rejects_by_area(self):
+        self.assertFalse(RegionFilter().accept(box(10, 10, 3, 3), 0.8, self.shape))
+        self.assertFalse(RegionFilter().accept(box(100, 100, 600, 400), 0.8, self.shape))
+
+    def test_rejects_by_position_and_score(self):
+        region_filter = RegionFilter(min_y=0.2, min_score=0.5)
+        self.assertFalse(region_filter.accept(box(700, 50, 90, 40), 0.8, self.shape))
+        self.assertFalse(region_filter.accept(box(700, 500, 90, 40), 0.3, self.shape))
+        self.assertEqual([True, False], region_filter.filter([box(700, 500, 90, 40), box(700, 50, 90, 40)],
+                                                             [0.8, 0.8], self.shape))
+
+    def test_bib_likeness(self):
+        self.assertEqual(1.0, bib_likeness(box(700, 500, 90, 40), self.shape))
+        # a long text line and a speck are less likely bib numbers
+        self.assertLess(bib_likeness(box(100, 500, 700, 40), self.shape), 0.5)
+        self.assertLess(bib_likeness(box(100, 500, 6, 4), self.shape), 0.5)
+
+    def test_rank_regions(self):
+        polys = [box(100, 500, 700, 40), box(700, 500, 90, 40), box(300, 300, 90, 40)]
+        self.assertEqual([1, 2, 0], rank_regions(polys, [0.9, 0.8, 0.5], self.shape))
+        self.assertEqual([2, 0], rank_regions(polys, [0.9, 0.8, 0.5], self.shape, [0, 2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
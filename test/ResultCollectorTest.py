@@ -0,0 +1,152 @@
+import os
+import tempfile
+import unittest
+
+from result import ResultState, ResultType
+from result_collector import ResultCollector
+
+
+class _Client:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, pending: [str]) -> bool:
+        self.sent += pending
+        return True
+
+
+class ResultCollectorTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.buffer_file = os.path.join(self.dir.name, "buffer.csv")
+        self.images = []
+        for name in ["a.jpg", "b.jpg", "c.jpg"]:
+            path = os.path.join(self.dir.name, name)
+            with open(path, "wb"):
+                pass
+            self.images.append(os.path.normpath(path))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def collector(self, client=None) -> ResultCollector:
+        return ResultCollector(client or _Client(), ResultType.FINISH, self.buffer_file, self.dir.name)
+
+    def test_restores_state_from_journal(self):
+        results = self.collector()
+        results.add_images(self.images)
+        results.detection_started(self.images[:2])
+        results.add_ai({self.images[0]: [12], self.images[1]: []})
+        results.close()
+
+        restored = self.collector()
+        self.assertEqual(ResultState.PENDING_MANUALLY, restored.results[self.images[0]].get_state())
+        self.assertEqual(ResultState.PENDING_MANUALLY, restored.results[self.images[1]].get_state())
+        self.assertEqual(ResultState.FTP_UPLOADED, restored.results[self.images[2]].get_state())
+        csv = restored.results[self.images[0]].get_csv()
+        self.assertEqual(1, len(csv))
+        self.assertTrue(csv[0].startswith("12;") and csv[0].endswith(";finish"))
+
+    def test_manual_entry_is_uploaded_and_persisted(self):
+        client = _Client()
+        results = self.collector(client)
+        results.add_images(self.images[:1])
+        results.detection_started(self.images[:1])
+        results.add_ai({self.images[0]: []})
+        self.assertEqual(self.images[0], results.get_manual_pending())
+        results.add_manually([7], "a.jpg")
+        # the upload runs in the background
+        self.assertTrue(results.uploader.flush(5))
+
+        self.assertEqual(1, len(client.sent))
+        self.assertTrue(client.sent[0].startswith("7;"))
+        restored = self.collector()
+        self.assertEqual(ResultState.UPLOADED, restored.results[self.images[0]].get_state())
+
+    def test_result_csv(self):
+        os.utime(self.images[0], (0, 1700000000.9999999))
+        results = self.collector()
+        results.add_images(self.images[:2], [1700000000.5, None])
+        results.detection_started(self.images[:2])
+        results.add_ai({self.images[0]: [12, 7], self.images[1]: []})
+
+        # a given mtime is used as is, a missing one is read from the file
+        self.assertEqual(["12;2023-11-14 22:13:20;finish", "7;2023-11-14 22:13:20;finish"],
+                         sorted(results.results[self.images[0]].get_csv()))
+        self.assertEqual([], results.results[self.images[1]].get_csv())
+        self.assertEqual("{};2;PENDING_MANUALLY;1700000000.5;{}\n".format(
+            self.images[0], ";".join(str(n) for n in {12, 7})), results.results[self.images[0]].get_one_line_csv())
+        # the known times are restored from the buffer, the file is not needed anymore
+        os.remove(self.images[0])
+        restored = self.collector()
+        self.assertEqual(["12;2023-11-14 22:13:20;finish", "7;2023-11-14 22:13:20;finish"],
+                         sorted(restored.results[self.images[0]].get_csv()))
+
+    def test_restore_old_buffer_lines(self):
+        os.utime(self.images[0], (0, 1700000000.9999999))
+        with open(self.buffer_file, "w") as f:
+            f.write("{};2;PENDING_UPLOAD;12;7\n{};2;PENDING_MANUALLY;\n".format(*self.images[:2]))
+        restored = self.collector()
+
+        # without a time in the line it comes from the file, rounded like datetime does
+        self.assertEqual(["12;2023-11-14 22:13:21;finish", "7;2023-11-14 22:13:21;finish"],
+                         sorted(restored.results[self.images[0]].get_csv()))
+        self.assertEqual(ResultState.PENDING_MANUALLY, restored.results[self.images[1]].get_state())
+
+    def test_peek_manual_pending(self):
+        results = self.collector()
+        results.add_images(self.images)
+        results.detection_started(self.images)
+        results.add_ai({img: [] for img in self.images})
+
+        self.assertEqual(self.images[:2], results.peek_manual_pending(2))
+        self.assertEqual(self.images[0], results.get_manual_pending())
+        self.assertEqual(self.images[1:], results.peek_manual_pending(5))
+
+    def test_compaction_keeps_state(self):
+        results = self.collector()
+        results.journal.compact_after = 2
+        results.add_images(self.images)
+        results.detection_started(self.images)
+        results.add_ai({img: [1] for img in self.images})
+
+        self.assertEqual(0, results.journal.entries)
+        with open(self.buffer_file) as f:
+            self.assertEqual(3, len(f.readlines()))
+        restored = self.collector()
+        self.assertTrue(all(r.get_state() == ResultState.PENDING_MANUALLY for r in restored.results.values()))
+
+    def test_ignores_incomplete_journal_line(self):
+        results = self.collector()
+        results.add_images(self.images[:1])
+        results.close()
+        with open(self.buffer_file + ".journal", "a") as f:
+            f.write(self.images[1] + ";2;PENDING_MAN")
+
+        restored = self.collector()
+        self.assertEqual([self.images[0]], list(restored.results.keys()))
+
+    def test_state_index_follows_transitions(self):
+        results = self.collector()
+        results.add_images(self.images)
+        self.assertEqual(3, results.count(ResultState.FTP_UPLOADED))
+        self.assertTrue(results.needs_detection(self.images[0]))
+
+        results.detection_started(self.images[:2])
+        self.assertEqual(1, results.count(ResultState.FTP_UPLOADED))
+        self.assertEqual(2, results.count(ResultState.DETECTING_AI))
+        self.assertFalse(results.needs_detection(self.images[0]))
+
+        results.add_ai({self.images[1]: [], self.images[0]: []})
+        self.assertEqual(self.images[1], results.get_manual_pending())
+        self.assertEqual(1, results.count(ResultState.PENDING_MANUALLY))
+        self.assertEqual(1, results.count(ResultState.DETECTING_MANUALLY))
+
+        results.add_images(self.images[2:])
+        self.assertEqual(1, results.count(ResultState.FTP_UPLOADED))
+        self.assertEqual([self.images[2]], [r.get_image() for r in results.get_ai_pending()])
+        self.assertEqual(0, results.count(ResultState.FTP_UPLOADED))
+
+
+if __name__ == '__main__':
+    unittest.main()
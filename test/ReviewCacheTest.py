@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from review_cache import ReviewCache
+
+
+def frame(seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 255, (1500, 2000, 3), dtype=np.uint8)
+
+
+class ReviewCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.dir.name, "review")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def image(self, name: str, seed: int = 0) -> str:
+        path = os.path.join(self.dir.name, name)
+        cv2.imwrite(path, frame(seed))
+        return path
+
+    def test_renders_frame_and_crops(self):
+        cache = ReviewCache(self.cache_dir, frame_size=640, crop_height=50)
+        image = self.image("a.jpg")
+        polys = [[[100, 100], [300, 100], [300, 160], [100, 160]], [[1000, 1000], [1100, 1000], [1100, 1020],
+                                                                    [1000, 1020]]]
+        cache.add(image, cv2.imread(image), polys, [0.5, 0.9])
+
+        rendered = cv2.imread(cache.get(image, "frame"))
+        self.assertEqual((480, 640, 3), rendered.shape)
+        crops = cv2.imread(cache.get(image, "crops"))
+        self.assertEqual(100, crops.shape[0])
+        # the region with the higher score comes first, both are grown by half their height on every side:
+        # 120x40 scaled to 150x50 and 260x120 scaled to 108x50, the narrower row is padded with white
+        self.assertEqual(150, crops.shape[1])
+        self.assertGreater(crops[50:, 120:].mean(), 250)
+        self.assertLess(crops[:50, 120:].mean(), 200)
+        self.assertLess(os.path.getsize(cache.get(image, "frame")), os.path.getsize(image))
+
+    def test_frame_is_rendered_on_demand(self):
+        cache = ReviewCache(self.cache_dir)
+        image = self.image("a.jpg")
+
+        self.assertIsNone(cache.get(image, "crops"))
+        self.assertIsNotNone(cache.get(image, "frame"))
+        self.assertIsNone(cache.get(os.path.join(self.dir.name, "missing.jpg"), "frame"))
+
+    def test_least_recently_used_are_removed(self):
+        cache = ReviewCache(self.cache_dir, frame_size=320)
+        images = [self.image(f"{i}.jpg", i) for i in range(3)]
+        cache.add(images[0], None, [])
+        size = cache.size
+        cache.max_bytes = int(size * 2.5)
+        cache.add(images[1], None, [])
+        # the first image is used again, so the second one is removed for the third
+        cache.get(images[0], "frame")
+        cache.add(images[2], None, [])
+
+        self.assertLessEqual(cache.size, cache.max_bytes)
+        self.assertEqual(2, len(os.listdir(self.cache_dir)))
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, ReviewCache.file_name(images[1], "frame"))))
+        # the size of the renditions on disk is known after a restart
+        self.assertEqual(cache.size, ReviewCache(self.cache_dir).size)
+
+    def test_discard(self):
+        cache = ReviewCache(self.cache_dir)
+        image = self.image("a.jpg")
+        cache.add(image, None, [[[10, 10], [50, 10], [50, 30], [10, 30]]])
+        cache.discard(image)
+
+        self.assertEqual(0, cache.size)
+        self.assertEqual([], os.listdir(self.cache_dir))
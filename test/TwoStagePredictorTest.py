@@ -0,0 +1,56 @@
+import unittest
+
+import numpy as np
+
+from detection.TwoStagePredictor import TwoStagePredictor, candidate_rois
+
+
+def box(x: float, y: float, w: float, h: float) -> np.ndarray:
+    return np.float32([[x, y], [x + w, y], [x + w, y + h], [x, y + h]])
+
+
+class FakeBatcher:
+    # finds one text region in the middle of every image it is given
+    def __init__(self):
+        self.calls = []
+
+    def prediction(self, image: np.ndarray) -> dict:
+        h, w = image.shape[:2]
+        return {"boxes": [box(w / 4, h / 4, w / 2, h / 2)], "polys": [box(w / 4, h / 4, w / 2, h / 2)],
+                "scores": [0.9], "heatmaps": {}, "times": {"craftnet_time": 1.0}, "batch_size": 1}
+
+    def predict(self, image: np.ndarray, long_size: int | None = None) -> dict:
+        self.calls.append(("predict", long_size))
+        return self.prediction(image)
+
+    def predict_batch(self, images: list[np.ndarray], long_sizes: list[int] | None = None) -> list[dict]:
+        self.calls.append(("predict_batch", long_sizes))
+        return [self.prediction(img) for img in images]
+
+
+class TwoStagePredictorTest(unittest.TestCase):
+    def test_rois_are_grown_and_merged(self):
+        rois = candidate_rois([box(100, 100, 40, 20), box(150, 105, 40, 20), box(500, 500, 40, 20)],
+                              (600, 800, 3), margin=0.5)
+        self.assertEqual([(90, 90, 200, 135), (490, 490, 550, 530)], rois)
+
+    def test_fine_pass_on_rois(self):
+        batcher = FakeBatcher()
+        image = np.zeros((1000, 2000, 3), dtype=np.uint8)
+        result = TwoStagePredictor(batcher, 1280, 640, MARGIN=0.0).predict(image)
+        # the coarse region is the middle of the frame, detected again at the scale of the full frame
+        self.assertEqual([("predict", 640), ("predict_batch", [640])], batcher.calls)
+        self.assertEqual([(500, 250, 1500, 750)], result["rois"])
+        np.testing.assert_allclose(box(750, 375, 500, 250), result["polys"][0])
+        self.assertEqual(2.0, result["times"]["craftnet_time"])
+
+    def test_falls_back_to_full_frame(self):
+        batcher = FakeBatcher()
+        image = np.zeros((1000, 2000, 3), dtype=np.uint8)
+        result = TwoStagePredictor(batcher, 1280, 640, MARGIN=1.0).predict(image)
+        self.assertEqual([("predict", 640), ("predict", 1280)], batcher.calls)
+        self.assertIsNone(result["rois"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from client import ApiClient
+from result import ResultType
+from result_collector import ResultCollector
+
+
+class _StubApi(BaseHTTPRequestHandler):
+    # records the uploaded lines, answers 503 to the first `failures` requests
+    protocol_version = "HTTP/1.1"
+    failures = 0
+    bodies = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+        status = 204
+        if _StubApi.failures > 0:
+            _StubApi.failures -= 1
+            status = 503
+        else:
+            _StubApi.bodies.append(body.splitlines()[1:])
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class UploaderTest(unittest.TestCase):
+    def setUp(self):
+        _StubApi.failures = 0
+        _StubApi.bodies = []
+        self.server = ThreadingHTTPServer(("localhost", 0), _StubApi)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = ApiClient(f"http://localhost:{self.server.server_port}/", "user", "password")
+        self.dir = tempfile.TemporaryDirectory()
+        self.buffer_file = os.path.join(self.dir.name, "buffer.csv")
+        self.images = []
+        for name in ["a.jpg", "b.jpg", "c.jpg"]:
+            path = os.path.join(self.dir.name, name)
+            with open(path, "wb"):
+                pass
+            # all images are taken at the same second, so equal numbers give equal tag_id;timestamp lines
+            os.utime(path, (1700000000, 1700000000))
+            self.images.append(os.path.normpath(path))
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.dir.cleanup()
+
+    def collector(self, batch_size: int = 1, window: float = 1.0) -> ResultCollector:
+        results = ResultCollector(self.client, ResultType.FINISH, self.buffer_file, self.dir.name, batch_size,
+                                  window)
+        results.uploader.backoff = 0.01
+        return results
+
+    def review(self, results: ResultCollector, numbers: dict[str, list[int]]):
+        results.add_images(list(numbers))
+        results.detection_started(list(numbers))
+        results.add_ai({img: [] for img in numbers})
+        for img in numbers:
+            self.assertEqual(img, results.get_manual_pending())
+            results.add_manually(numbers[img], os.path.basename(img))
+
+    def test_batches_pending_results(self):
+        results = self.collector(batch_size=2, window=60)
+        self.review(results, {self.images[0]: [1], self.images[1]: [2]})
+        self.assertTrue(results.uploader.flush(5))
+
+        self.assertEqual(1, len(_StubApi.bodies))
+        self.assertEqual({"1", "2"}, {line.split(";")[0] for line in _StubApi.bodies[0]})
+        results.close()
+
+    def test_window_sends_incomplete_batch(self):
+        results = self.collector(batch_size=10, window=0.1)
+        self.review(results, {self.images[0]: [1]})
+        for _ in range(100):
+            if len(_StubApi.bodies) > 0:
+                break
+            threading.Event().wait(0.05)
+        self.assertEqual(1, len(_StubApi.bodies))
+        results.close()
+
+    def test_retries_failed_upload(self):
+        _StubApi.failures = 2
+        results = self.collector()
+        self.review(results, {self.images[0]: [1]})
+        self.assertTrue(results.uploader.flush(5))
+
+        # both failed attempts were retried and the third one got through
+        self.assertEqual(0, _StubApi.failures)
+        self.assertEqual(1, len(_StubApi.bodies))
+        results.close()
+
+    def test_sent_lines_are_not_sent_again(self):
+        results = self.collector()
+        self.review(results, {self.images[0]: [1]})
+        self.assertTrue(results.uploader.flush(5))
+        results.close()
+
+        # the same entry from another image is not sent twice, even after a restart
+        results = self.collector()
+        self.review(results, {self.images[1]: [1, 2]})
+        self.assertTrue(results.uploader.flush(5))
+        results.close()
+
+        self.assertEqual(2, len(_StubApi.bodies))
+        sent = [line.split(";")[0] for body in _StubApi.bodies for line in body]
+        self.assertEqual(1, sent.count("1"))
+
+    def test_missing_image_does_not_block_uploads(self):
+        # restored without a time (written by an older version), the image was deleted in the meantime
+        with open(self.buffer_file, "w") as f:
+            f.write("{};2;PENDING_UPLOAD;1\n{};2;PENDING_UPLOAD;2\n".format(*self.images[:2]))
+        os.remove(self.images[0])
+        results = self.collector(batch_size=2, window=0)
+        self.assertTrue(results.uploader.flush(5))
+
+        self.assertEqual([[line.split(";")[0] for line in body] for body in _StubApi.bodies], [["2"]])
+        self.assertEqual([self.images[0]], list(results.upload_failed))
+        results.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Set
+
+from result import Result
+
+
+def line_key(line: str) -> str:
+    # tag_id;timestamp identifies an entry of the timing API
+    return ";".join(line.split(";")[:2])
+
+
+class Uploader:
+    # uploads the results waiting for the upload on a background thread, so a slow timing API does not hold back
+    # the reviewers. Results are sent in batches of batch_size or after they waited window seconds, failed uploads
+    # are retried with exponential backoff and full jitter. Lines already accepted by the API are recorded in
+    # sent_file and never sent again, so a batch interrupted by a crash can safely be uploaded a second time.
+    # A result whose lines can not be built (e.g. its image was deleted before its time was known) is handed to
+    # failed, so it does not block the results behind it.
+
+    def __init__(self, client, pending: Callable[[int], List[Result]], uploaded: Callable[[List[Result]], None],
+                 count: Callable[[], int], batch_size: int = 1, window: float = 1.0, sent_file: str | None = None,
+                 backoff: float = 0.5, max_backoff: float = 60.0,
+                 failed: Callable[[List[Result]], None] | None = None):
+        self.client = client
+        self.pending = pending
+        self.uploaded = uploaded
+        self.failed = failed
+        self.count = count
+        self.batch_size = batch_size
+        self.window = window
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.sent_file = sent_file
+        self.sent: Set[str] = set()
+        if sent_file is not None and os.path.exists(sent_file):
+            with open(sent_file, 'r') as f:
+                self.sent = {line.strip() for line in f if line.endswith("\n")}
+        self.__sent_out = None
+
+        self.__first_pending: float | None = None
+        self.__flushing = False
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.__run, name="uploader", daemon=True)
+        self.thread.start()
+
+    def notify(self) -> None:
+        # called when results reached the upload state
+        self.wake.set()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        # uploads everything pending without waiting for the window, returns False if it is not done in time
+        deadline = None if timeout is None else time.time() + timeout
+        self.__flushing = True
+        try:
+            while self.count() > 0:
+                if self.stopped.is_set() or (deadline is not None and time.time() >= deadline):
+                    return False
+                self.wake.set()
+                time.sleep(0.01)
+            return True
+        finally:
+            self.__flushing = False
+
+    def __wait_time(self) -> float | None:
+        # seconds until the next batch is due, None if nothing is pending
+        pending = self.count()
+        if pending == 0:
+            self.__first_pending = None
+            return None
+        if self.__first_pending is None:
+            self.__first_pending = time.time()
+        if pending >= self.batch_size or self.__flushing:
+            return 0
+        return max(self.__first_pending + self.window - time.time(), 0)
+
+    def __run(self):
+        while not self.stopped.is_set():
+            self.wake.clear()
+            wait = self.__wait_time()
+            if wait is None or wait > 0:
+                self.wake.wait(wait)
+                continue
+            batch = self.pending(self.batch_size)
+            lines, broken = self.__lines(batch)
+            if len(broken) > 0:
+                if self.failed is not None:
+                    self.failed(broken)
+                batch = [r for r in batch if r not in broken]
+            try:
+                ok = self.__upload(lines)
+            except Exception as e:
+                logging.error("Upload failed: {}".format(e))
+                ok = False
+            if ok:
+                self.failures = 0
+                self.uploaded(batch)
+                self.__first_pending = None
+            else:
+                self.failures += 1
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (self.failures - 1)))
+                logging.warning("Upload of {} results failed, retrying in {:.1f}s".format(len(batch), delay))
+                self.stopped.wait(delay)
+
+    def __lines(self, batch: List[Result]) -> (Dict[str, str], List[Result]):
+        # the lines not sent yet by their key and the results whose lines could not be built
+        lines = {}
+        broken = []
+        for r in batch:
+            try:
+                csv = r.get_csv()
+            except Exception as e:
+                logging.error("Result of {} can not be uploaded, it is put aside: {}".format(r.get_image(), e))
+                broken.append(r)
+                continue
+            for line in csv:
+                if line_key(line) not in self.sent:
+                    lines.setdefault(line_key(line), line)
+        return lines, broken
+
+    def __upload(self, lines: Dict[str, str]) -> bool:
+        if len(lines) == 0:
+            return True
+        if not self.client.send(list(lines.values())):
+            return False
+        self.sent.update(lines.keys())
+        if self.sent_file is not None:
+            if self.__sent_out is None:
+                self.__sent_out = open(self.sent_file, 'a')
+            self.__sent_out.writelines(k + "\n" for k in lines.keys())
+            self.__sent_out.flush()
+            os.fsync(self.__sent_out.fileno())
+        return True
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.wake.set()
+        self.thread.join()
+        if self.__sent_out is not None:
+            self.__sent_out.close()
+            self.__sent_out = None
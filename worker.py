@@ -0,0 +1,50 @@
+import argparse
+import logging
+import time
+
+from detection import backends
+from detection.BibNumberDetector import BibNumberDetector
+from detection.ResultCache import ResultCache
+from detection.service.IndexedBibNumberService import IndexedBibNumberService
+from job_table import JobTable, JobWorker
+
+
+def main():
+    # an additional detection host: claims images from the job table of the server on a shared path, the image
+    # directory must be reachable under the same path as on the server
+    parser = argparse.ArgumentParser(description="detects the images queued in a shared job table")
+    parser.add_argument("jobs", help="path to the SQLite job table of the server")
+    parser.add_argument("-o", "--out", help="path to the output directory", default="temp/ai")
+    parser.add_argument("-t", "--threads", help="number of images detected at once", default=2, type=int)
+    parser.add_argument("--lease", help="seconds an image stays claimed without a heartbeat", default=60.0,
+                        type=float)
+    parser.add_argument("--cache", help="path to a local result cache")
+    parser.add_argument("--bibs", help="csv file with the registered bib numbers in the first column")
+    parser.add_argument("--burst-distance", help="treat near identical images as the same burst", type=int)
+    parser.add_argument("--backend", help="inference backend of CRAFT", default="torch", choices=backends.BACKENDS)
+    parser.add_argument("-log", "--log", help="log level", default="info",
+                        choices=["debug", "info", "warning", "error", "critical"])
+    args = parser.parse_args()
+    logging.basicConfig(level=getattr(logging, args.log.upper()),
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt='%d-%b-%y %H:%M:%S')
+
+    jobs = JobTable(args.jobs, lease=args.lease)
+    bib_number_svc = IndexedBibNumberService.from_csv(args.bibs, fuzzy=True) if args.bibs else None
+    cache = ResultCache(args.cache) if args.cache else None
+    with BibNumberDetector(args.out, args.threads, CACHE=cache, BIB_NUMBER_SVC=bib_number_svc,
+                           BURST_DISTANCE=args.burst_distance, BACKEND=args.backend) as detector:
+        worker = JobWorker(detector, jobs, args.threads)
+        logging.info("Worker {} started".format(worker.name))
+        try:
+            while True:
+                time.sleep(60)
+                logging.info("{} images detected, queue: {}".format(worker.processed, jobs.counts()))
+        except KeyboardInterrupt:
+            pass
+        worker.stop()
+    jobs.close()
+    logging.info("Worker stopped")
+
+
+if __name__ == '__main__':
+    main()